@@ -0,0 +1,277 @@
+"""
+Loading of the address workbook, shared by the command line tool and the GUI.
+"""
+import base64
+import copy
+import hashlib
+import io
+import os
+import pickle
+
+import msoffcrypto
+import openpyxl
+import pandas as pd
+from cryptography.fernet import Fernet, InvalidToken
+
+from matching import AddressIndex
+
+# Columns of the address list used for matching and the receipts
+ADDRESS_COLUMNS = ['Name', 'Straße', 'PLZ', 'Ort']
+
+# Encrypted xlsx files are OLE compound files instead of zip archives
+OLE_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+# Address data loaded in this process, see load_addresses
+_address_cache = {}
+# Address data with its AddressIndex loaded in this process, see load_indexed_addresses
+_indexed_address_cache = {}
+
+# Header of an address snapshot file; bump the version when AddressIndex changes
+SNAPSHOT_MAGIC = b'ANWADDR2'
+SNAPSHOT_SALT_SIZE = 16
+# Iterations of the snapshot key derivation, a trade-off against the load time
+SNAPSHOT_KDF_ITERATIONS = 200000
+
+
+def decrypt_workbook(excel_path, password=None):
+    """
+    Decrypt a password-protected Excel file using msoffcrypto.
+
+    Args:
+        excel_path (str): Path to the Excel file
+        password (str): Password for the protected file
+    Returns:
+        io.BytesIO: The decrypted workbook
+    """
+    decrypted_workbook = io.BytesIO()
+    try:
+        with open(excel_path, 'rb') as file:
+            office_file = msoffcrypto.OfficeFile(file)
+            if password:
+                office_file.load_key(password=password)
+            office_file.decrypt(decrypted_workbook)
+    except Exception as e:
+        raise ValueError(f"Decryption failed, check the entered password. ({str(e)})") from e
+    return decrypted_workbook
+
+
+def is_encrypted(excel_path):
+    """Tell from the file header whether an Excel file is encrypted."""
+    with open(excel_path, 'rb') as file:
+        return file.read(len(OLE_SIGNATURE)) == OLE_SIGNATURE
+
+
+def read_address_sheet(workbook_file, columns=ADDRESS_COLUMNS):
+    """
+    Read the active sheet of an address workbook in one streaming pass.
+
+    The workbook is opened read-only and the rows are read as plain values
+    straight into one list per column, without cell objects or a dict per row.
+
+    Args:
+        workbook_file: Path or file object of the workbook
+        columns (list): Headers of the columns to read, None reads all columns
+    Returns:
+        pandas.DataFrame: The address data below the header row
+    """
+    workbook = openpyxl.load_workbook(filename=workbook_file, read_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        headers = list(next(rows, ()))
+
+        if columns is None:
+            columns = headers
+        missing = [column for column in columns if column not in headers]
+        if missing:
+            raise ValueError(f"Address file is missing the columns: {', '.join(map(str, missing))}")
+        positions = [headers.index(column) for column in columns]
+
+        values = [[] for _ in positions]
+        for row in rows:
+            # Rows of a read-only sheet end at their last cell
+            for column_values, pos in zip(values, positions):
+                column_values.append(row[pos] if pos < len(row) else None)
+
+        return pd.DataFrame(dict(zip(columns, values)))
+    finally:
+        workbook.close()
+
+
+def _cache_key(excel_path, password, columns):
+    """Key of a loaded workbook: path, modification time, size, password hash and columns."""
+    path = os.path.abspath(excel_path)
+    stat = os.stat(path)
+    password_hash = hashlib.sha256((password or '').encode('utf-8')).hexdigest()
+    return path, stat.st_mtime_ns, stat.st_size, password_hash, tuple(columns) if columns is not None else None
+
+
+def load_addresses(excel_path, password=None, columns=ADDRESS_COLUMNS):
+    """
+    Load an address workbook, decrypting it only if it is encrypted.
+
+    The parsed data is kept for the rest of the process, keyed by path,
+    modification time, size, password hash and columns, so loading an
+    unchanged file again skips the decryption and parsing.
+
+    Args:
+        excel_path (str): Path to the Excel file
+        password (str): Password for an encrypted file
+        columns (list): Headers of the columns to read, None reads all columns
+    Returns:
+        pandas.DataFrame: The address data, a copy the caller may change
+    """
+    key = _cache_key(excel_path, password, columns)
+    path = key[0]
+
+    if key not in _address_cache:
+        workbook_file = decrypt_workbook(path, password) if is_encrypted(path) else path
+        address_df = read_address_sheet(workbook_file, columns)
+
+        # Older versions of the file are not needed anymore
+        for stale_key in [k for k in _address_cache if k[0] == path]:
+            del _address_cache[stale_key]
+        _address_cache[key] = address_df
+
+    return _address_cache[key].copy()
+
+
+def workbook_fingerprint(excel_path, columns=ADDRESS_COLUMNS):
+    """
+    Return a hash of the workbook file and the columns read from it.
+
+    Args:
+        excel_path (str): Path to the Excel file, hashed as stored, encrypted or not
+        columns (list): Headers of the columns to read, None reads all columns
+    Returns:
+        bytes: SHA-256 digest
+    """
+    digest = hashlib.sha256(repr(columns).encode('utf-8'))
+    with open(excel_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _snapshot_cipher(password, salt):
+    """Return the cipher of a snapshot, keyed by the workbook password."""
+    key = hashlib.pbkdf2_hmac('sha256', (password or '').encode('utf-8'), salt, SNAPSHOT_KDF_ITERATIONS)
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+def read_snapshot(snapshot_path, fingerprint, password=None):
+    """
+    Read an address snapshot written by write_snapshot.
+
+    Args:
+        snapshot_path (str): Path of the snapshot file
+        fingerprint (bytes): workbook_fingerprint of the current workbook
+        password (str): Password of the workbook
+    Returns:
+        tuple: (address_df, address_index), or None if the snapshot is
+            missing, belongs to another workbook or cannot be decrypted,
+            always None without a password
+    """
+    # Anyone could create a snapshot for an empty password, never unpickle it
+    if not password:
+        return None
+
+    try:
+        with open(snapshot_path, 'rb') as file:
+            data = file.read()
+    except OSError:
+        return None
+
+    salt_end = len(SNAPSHOT_MAGIC) + SNAPSHOT_SALT_SIZE
+    header_end = salt_end + len(fingerprint)
+    if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC or data[salt_end:header_end] != fingerprint:
+        return None
+
+    try:
+        payload = _snapshot_cipher(password, data[len(SNAPSHOT_MAGIC):salt_end]).decrypt(data[header_end:])
+        return pickle.loads(payload)
+    except (InvalidToken, pickle.UnpicklingError, AttributeError, ImportError, EOFError):
+        return None
+
+
+def write_snapshot(snapshot_path, fingerprint, address_df, address_index, password=None):
+    """
+    Write the parsed address data and its index to an encrypted snapshot.
+
+    The pickled data is encrypted and authenticated with a key derived from
+    the workbook password and a random salt. Without a password anyone could
+    write a valid snapshot, so there is none for unencrypted workbooks.
+
+    Args:
+        snapshot_path (str): Path of the snapshot file, replaced atomically
+        fingerprint (bytes): workbook_fingerprint of the workbook
+        address_df (pandas.DataFrame): The address data
+        address_index (AddressIndex): Index of the address data
+        password (str): Password of the workbook
+    Raises:
+        ValueError: If the password is empty
+    """
+    if not password:
+        raise ValueError('An address snapshot needs the password of an encrypted workbook')
+
+    salt = os.urandom(SNAPSHOT_SALT_SIZE)
+    payload = pickle.dumps((address_df, address_index), protocol=pickle.HIGHEST_PROTOCOL)
+    token = _snapshot_cipher(password, salt).encrypt(payload)
+
+    temp_path = snapshot_path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(SNAPSHOT_MAGIC + salt + fingerprint + token)
+    os.replace(temp_path, snapshot_path)
+
+
+def load_indexed_addresses(excel_path, password=None, columns=ADDRESS_COLUMNS, snapshot_path=None):
+    """
+    Load an address workbook together with its AddressIndex.
+
+    Both are kept for the rest of the process like in load_addresses, so
+    loading an unchanged file again only copies them. Otherwise an encrypted
+    workbook with a snapshot path is restored from the snapshot instead of
+    being parsed and indexed again, or the snapshot is (re)written after
+    loading. Unencrypted workbooks have no snapshot, see write_snapshot.
+
+    Args:
+        excel_path (str): Path to the Excel file
+        password (str): Password for an encrypted file
+        columns (list): Headers of the columns to read, None reads all columns
+        snapshot_path (str): Path of the encrypted snapshot file, None disables it
+    Returns:
+        tuple: (address_df, address_index), copies the caller may change
+    """
+    key = _cache_key(excel_path, password, columns)
+
+    if key not in _indexed_address_cache:
+        if not (password and is_encrypted(excel_path)):
+            snapshot_path = None
+        indexed_addresses = _load_indexed_addresses(excel_path, password, columns, snapshot_path)
+
+        # Older versions of the file are not needed anymore
+        for stale_key in [k for k in _indexed_address_cache if k[0] == key[0]]:
+            del _indexed_address_cache[stale_key]
+        _indexed_address_cache[key] = indexed_addresses
+
+    # The index keeps referring to the copied address data
+    return copy.deepcopy(_indexed_address_cache[key])
+
+
+def _load_indexed_addresses(excel_path, password, columns, snapshot_path):
+    """Load an address workbook and its AddressIndex, from the snapshot if it is up to date."""
+    if snapshot_path:
+        fingerprint = workbook_fingerprint(excel_path, columns)
+        snapshot = read_snapshot(snapshot_path, fingerprint, password)
+        if snapshot is not None:
+            return snapshot
+
+    address_df = load_addresses(excel_path, password, columns)
+    address_index = AddressIndex(address_df)
+
+    if snapshot_path:
+        try:
+            write_snapshot(snapshot_path, fingerprint, address_df, address_index, password)
+        except OSError as e:
+            print(f"Could not write address snapshot: {str(e)}")
+
+    return address_df, address_index
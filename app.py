@@ -1,23 +1,33 @@
+from __future__ import annotations
+
+import time
+
+# Taken before the other imports, the start of the startup time
+STARTUP_TIME = time.perf_counter()
+
 from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import pandas as pd
-from thefuzz import fuzz
 import os
+import sys
+import threading
 from datetime import datetime
-from dateutil import parser
-from typing import Optional, Dict, List
-import msoffcrypto
-import io
-import openpyxl
+from typing import Optional, Dict, List, Tuple, TYPE_CHECKING
 import json
 import os.path
-from docx2pdf import convert
 # from tqdm import tqdm
 import csv
+import multiprocessing
+
+# pandas, docx2pdf and the data modules take seconds to import, even longer
+# from the onefile executable. They are imported where they are used, after
+# the window is shown, and loaded ahead by warm_up_imports.
+if TYPE_CHECKING:
+    import pandas as pd
+    from matching import AddressIndex, MatchCache
 
 class DonationReceiptApp:
-    def __init__(self, root):
+    def __init__(self, root, measure_startup=False):
         self.root = root
         self.root.title("Donation Receipt Generator")
         self.root.geometry("1400x800")
@@ -28,13 +38,25 @@ class DonationReceiptApp:
 
         # Data storage
         self.address_df: Optional[pd.DataFrame] = None
+        self.address_index: Optional[AddressIndex] = None
+        self.match_cache: Optional[MatchCache] = None
         self.bank_df: Optional[pd.DataFrame] = None
         self.matched_data: List[Dict] = []
+        # Name matching results of the loaded donations, per donor name
+        self.matches: Dict = {}
 
         # Config file path
         self.config_file = os.path.join(
             os.path.expanduser("."), ".donation_receipt_config.json"
         )
+        # Match cache file, kept next to the config file
+        self.match_cache_file = os.path.join(
+            os.path.expanduser("."), ".donation_receipt_matches.sqlite"
+        )
+        # Encrypted snapshot of the parsed address file
+        self.address_snapshot_file = os.path.join(
+            os.path.expanduser("."), ".donation_receipt_addresses.snapshot"
+        )
 
         # Load saved paths
         self.load_config()
@@ -44,6 +66,39 @@ class DonationReceiptApp:
 
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
+        # Seconds from the start of the process to the first drawn window
+        self.startup_seconds: Optional[float] = None
+        self.measure_startup = measure_startup
+        self.root.bind("<Map>", self.on_map, add="+")
+
+    def on_map(self, event):
+        """Once the main window is mapped, measure the startup after it is drawn"""
+        if event.widget is self.root and self.startup_seconds is None:
+            self.startup_seconds = 0.0
+            self.root.after_idle(self.report_startup_time)
+
+    def report_startup_time(self):
+        """Print the time to the first drawn window and start loading the heavy modules"""
+        self.root.update_idletasks()
+        self.startup_seconds = time.perf_counter() - STARTUP_TIME
+        print(f"Startup time to first window: {self.startup_seconds:.3f}s")
+        if self.measure_startup:
+            self.root.destroy()
+            return
+        threading.Thread(target=self.warm_up_imports, daemon=True).start()
+
+    def warm_up_imports(self):
+        """Import the modules needed for loading the data while the window waits for input"""
+        try:
+            import pandas
+            import receipts
+            import addresses
+            import bank_statements
+            import matching
+            import docx2pdf
+        except Exception as e:
+            print(f"Could not import in the background: {str(e)}")
+
     def set_initial_focus(self):
         """Set initial focus on the load button"""
         if hasattr(self, "load_button"):
@@ -59,6 +114,8 @@ class DonationReceiptApp:
             "log_dir": "",
             "output_dir_pdf": "",
             "geometry": "",
+            "jobs": 1,
+            "collective": False,
         }
 
         try:
@@ -81,6 +138,8 @@ class DonationReceiptApp:
                 "log_dir": self.log_dir_var.get(),
                 "output_dir_pdf": self.output_dir_pdf_var.get(),
                 "geometry": self.root.geometry(),
+                "jobs": self.receipt_jobs(),
+                "collective": self.collective_var.get(),
             }
 
             with open(self.config_file, "w", encoding="utf-8") as f:
@@ -136,7 +195,7 @@ class DonationReceiptApp:
         )
 
         # Bank File Selection
-        ttk.Label(file_frame, text="Bank Statement (.csv):").grid(
+        ttk.Label(file_frame, text="Bank Statements (.csv/folder):").grid(
             row=1, column=0, sticky=tk.W, pady=(5, 0)
         )
         self.bank_file_var = tk.StringVar(value=self.config["bank_file"])
@@ -261,6 +320,8 @@ class DonationReceiptApp:
         Returns:
             str: Path to the generated PDF file
         """
+        from docx2pdf import convert
+
         try:
             # Create PDF filename from Word filename
             pdf_filename = os.path.splitext(os.path.basename(docx_path))[0] + '.pdf'
@@ -353,6 +414,21 @@ class DonationReceiptApp:
             row=0, column=2
         )
 
+        # Number of worker processes generating the receipts
+        jobs_frame = ttk.Frame(output_frame)
+        jobs_frame.grid(row=0, column=3)
+        ttk.Label(jobs_frame, text="Parallel jobs:").pack(side=tk.LEFT)
+        self.jobs_var = tk.StringVar(value=str(self.config["jobs"]))
+        ttk.Spinbox(
+            jobs_frame, from_=1, to=os.cpu_count() or 1, textvariable=self.jobs_var, width=4
+        ).pack(side=tk.LEFT, padx=5)
+
+        # One collective receipt (Sammelbestätigung) per address and year instead of one per donation
+        self.collective_var = tk.BooleanVar(value=self.config["collective"])
+        ttk.Checkbutton(
+            jobs_frame, text="Annual collective receipts", variable=self.collective_var
+        ).pack(side=tk.LEFT, padx=5)
+
         # Output Directory Selection
         ttk.Label(output_frame, text="Output Directory (docx)").grid(
             row=1, column=0, sticky=tk.W, pady=(5, 0)
@@ -419,17 +495,16 @@ class DonationReceiptApp:
             self.save_config()
 
     def browse_bank_file(self):
-        """Open file dialog for bank file selection"""
-        filename = filedialog.askopenfilename(
+        """Open file dialog for bank file selection, several files may be selected"""
+        from bank_statements import PATH_SEPARATOR
+
+        current = self.bank_file_var.get().split(PATH_SEPARATOR)[0].strip()
+        filenames = filedialog.askopenfilenames(
             filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
-            initialdir=(
-                os.path.dirname(self.bank_file_var.get())
-                if self.bank_file_var.get()
-                else None
-            ),
+            initialdir=os.path.dirname(current) if current else None,
         )
-        if filename:
-            self.bank_file_var.set(filename)
+        if filenames:
+            self.bank_file_var.set(PATH_SEPARATOR.join(filenames))
             self.save_config()
 
     def browse_output_dir(self):
@@ -461,6 +536,8 @@ class DonationReceiptApp:
 
     def load_data(self):
         """Load and process the data files"""
+        from matching import normalize_iban
+
         try:
             # Create progress dialog
             progress = LoadingProgressDialog(self.root)
@@ -471,7 +548,7 @@ class DonationReceiptApp:
 
             # Load address file
             progress.update_status("Loading address file...", 10)
-            self.address_df = self.load_address_data(
+            self.address_df, self.address_index = self.load_address_data(
                 self.address_file_var.get(), self.password_var.get()
             )
 
@@ -482,32 +559,55 @@ class DonationReceiptApp:
             # Process matches
             progress.update_status("Processing matches...", 50)
             total_records = len(self.bank_df)
+            self.open_match_cache()
+            donations = self.bank_df
+
+            # Donations from a known IBAN skip the name matching
+            ibans = donations["Kontonummer/IBAN"].map(normalize_iban)
+            iban_matches = self.match_cache.lookup_ibans(ibans)
+            matches = self.find_best_matches(
+                donations["Beguenstigter/Zahlungspflichtiger"][
+                    ~ibans.isin(list(iban_matches))
+                ]
+            )
 
             self.matched_data = []
-            for i, donation in enumerate(self.bank_df.iterrows()):
-                if donation[1]["Betrag"] <= 0:
-                    continue
-
-                donor_name = donation[1]["Beguenstigter/Zahlungspflichtiger"]
-                amount = float(str(donation[1]["Betrag"]).replace(",", "."))
-                date = self.format_date_str(donation[1]["Buchungstag"])
-                purpose = donation[1]["Verwendungszweck"]
-
-                # Find best match
-                best_match, score = self.find_best_match(donor_name)
+            dates = (
+                donations["Buchungstag"]
+                .dt.strftime("%d.%m.%Y")
+                .fillna("Invalid date format")
+            )
+            for i, (donor_name, amount, date, purpose, iban) in enumerate(
+                zip(
+                    donations["Beguenstigter/Zahlungspflichtiger"],
+                    donations["Betrag"],
+                    dates,
+                    donations["Verwendungszweck"],
+                    ibans,
+                )
+            ):
+                # Look up best match and the runner-up candidates, by IBAN if it is known
+                if iban in iban_matches:
+                    (best_match, score), candidates = iban_matches[iban], []
+                    source = "iban"
+                else:
+                    best_match, score, candidates = matches[donor_name]
+                    source = "name"
+                    if best_match is not None:
+                        # Kept with its score, so weak matches stay highlighted
+                        self.match_cache.record_iban(
+                            iban, best_match, score, confirmed=False
+                        )
 
                 match_data = {
                     "donor_name": donor_name,
-                    "matched_name": (
-                        best_match["Name"] if best_match is not None else ""
-                    ),
-                    "street": best_match["Straße"] if best_match is not None else "",
-                    "postal_code": best_match["PLZ"] if best_match is not None else "",
-                    "city": best_match["Ort"] if best_match is not None else "",
+                    **self.match_fields(best_match, score),
                     "amount": f"{amount:.2f}",
                     "date": date,
-                    "match_score": f"{score:.1f}" if score > 0 else "0.0",
                     "purpose": purpose,
+                    "candidates": candidates,
+                    "iban": iban,
+                    "source": source,
                 }
 
                 self.matched_data.append(match_data)
@@ -518,6 +618,10 @@ class DonationReceiptApp:
                     f"Matching records... ({i+1}/{total_records})", progress_value
                 )
 
+            self.matches = matches
+            self.match_cache.save()
+            print(self.match_cache.summary())
+
             # Update table
             progress.update_status("Updating display...", 90)
             self.update_table()
@@ -534,84 +638,55 @@ class DonationReceiptApp:
 
     def load_address_data(
         self, excel_path: str, password: Optional[str]
-    ) -> pd.DataFrame:
+    ) -> Tuple[pd.DataFrame, AddressIndex]:
         """
         Load the address Excel file, handling both encrypted and unencrypted files.
-        First tries to load the file directly, falls back to decryption if needed.
+        Encrypted files are recognized by their header; an unchanged encrypted
+        file is restored from the encrypted snapshot instead of being parsed again.
         
         Args:
             excel_path: Path to the Excel file
             password: Optional password for encrypted files
         
         Returns:
-            pandas.DataFrame: Loaded data from the Excel file
+            tuple: Loaded data from the Excel file and its AddressIndex
         """
+        from addresses import load_indexed_addresses
+
         try:
-            # First try to load the file directly
-            try:
-                workbook = openpyxl.load_workbook(filename=excel_path)
-            except:
-                try:
-                    # If direct load fails, try decryption
-                    decrypted_workbook = io.BytesIO()
-                    with open(excel_path, "rb") as file:
-                        office_file = msoffcrypto.OfficeFile(file)
-                        if password:
-                            office_file.load_key(password=password)
-                        office_file.decrypt(decrypted_workbook)
-                    workbook = openpyxl.load_workbook(filename=decrypted_workbook)
-                except:
-                    raise Exception(f"Decryption failed, check the entered password.")
-
-            sheet = workbook.active
-            data = []
-            headers = [cell.value for cell in sheet[1]]
-
-            for row in sheet.iter_rows(min_row=2):
-                row_data = {}
-                for header, cell in zip(headers, row):
-                    row_data[header] = cell.value
-                data.append(row_data)
-
-            return pd.DataFrame(data)
+            # All columns are read, update_address_file writes the list back
+            return load_indexed_addresses(
+                excel_path,
+                password,
+                columns=None,
+                snapshot_path=self.address_snapshot_file,
+            )
 
         except Exception as e:
             raise Exception(f"Error reading Excel file: {str(e)}")
 
-    def load_bank_data(self, csv_path: str) -> pd.DataFrame:
-        """Load the bank CSV file"""
-        encodings = ["utf-8", "iso-8859-1", "cp1252", "latin1"]
-
-        for encoding in encodings:
-            try:
-                with open(csv_path, "r", encoding=encoding) as file:
-                    first_line = file.readline()
-                    delimiter = ";" if ";" in first_line else ","
-
-                df = pd.read_csv(
-                    csv_path,
-                    sep=delimiter,
-                    encoding=encoding,
-                    decimal=",",
-                )
-
-                return df[
-                    ["Buchungstag", "Beguenstigter/Zahlungspflichtiger", "Betrag", "Verwendungszweck"]
-                ]
-
-            except UnicodeDecodeError:
-                continue
-            except Exception as e:
-                continue
-
-        raise ValueError(
-            "Could not read the CSV file with any of the attempted encodings"
+    def load_bank_data(self, csv_paths: str) -> pd.DataFrame:
+        """Load the donations of the bank CSV files or folders separated by PATH_SEPARATOR
+        in parallel, dropping transactions repeated by overlapping statements"""
+        from bank_statements import (
+            PATH_SEPARATOR,
+            load_bank_statements,
+            normalize_transactions,
         )
 
+        paths = [path.strip() for path in csv_paths.split(PATH_SEPARATOR) if path.strip()]
+        df, file_count, duplicates = load_bank_statements(paths)
+        if file_count > 1:
+            print(
+                f"Read {len(df)} bank transactions from {file_count} files, "
+                f"{duplicates} duplicates removed"
+            )
+        return normalize_transactions(df)
+
     def log_receipt(self, receipt_data):
         """Log receipt information to year-specific CSV files in the selected directory."""
-        # Determine the year from the donation date
-        donation_date = datetime.strptime(receipt_data['donation_date'], "%d.%m.%Y")
+        # Determine the year from the donation date, collective receipts log their first - last date
+        donation_date = datetime.strptime(receipt_data['donation_date'][-10:], "%d.%m.%Y")
         year = donation_date.year
         log_file = os.path.join(self.log_dir_var.get(), f"spendenbescheinigungen_{year}.csv")
 
@@ -659,191 +734,109 @@ class DonationReceiptApp:
                 writer.writerow(new_entry)
 
 
-    def process_matches(self):
-        """Process and match the loaded data"""
-        self.matched_data = []
-
-        for _, donation in self.bank_df.iterrows():
-            if donation["Betrag"] <= 0:
-                continue
-
-            donor_name = donation["Beguenstigter/Zahlungspflichtiger"]
-            amount = float(str(donation["Betrag"]).replace(",", "."))
-            date = donation["Buchungstag"]
-            purpose = donation["Verwendungszweck"]
-
-            # Find best match
-            best_match, score = self.find_best_match(donor_name)
-
-            match_data = {
-                "donor_name": donor_name,
-                "matched_name": best_match["Name"] if best_match is not None else "",
-                "street": best_match["Straße"] if best_match is not None else "",
-                "postal_code": best_match["PLZ"] if best_match is not None else "",
-                "city": best_match["Ort"] if best_match is not None else "",
-                "amount": f"{amount:.2f}",
-                "date": date,
-                "match_score": f"{score:.1f}" if score > 0 else "0.0",
-                "purpose": purpose,
-            }
-
-            self.matched_data.append(match_data)
+    def open_match_cache(self, threshold=80, top_k=5):
+        """Open the persistent match cache for the loaded address list"""
+        from matching import MatchCache, PersistentMatchCache
 
-    def split_multiple_names(self, full_name):
-        """
-        Split a string containing multiple names into separate names.
-        Handles various formats and separators.
-        """
-        full_name = str(full_name).strip()
-
-        # List of possible separators
-        separators = [
-            " Und ",
-            " und ",
-            " U. ",
-            " u. ",
-            " And ",
-            " and ",
-            " & ",
-            " + ",
-            "   ",
-        ]
-
-        # First try explicit separators
-        for sep in separators:
-            if sep in full_name:
-                split_names = full_name.split(sep)
-                if len(split_names[0].split(" ")) == 1:
-                    split_names = [
-                        split_names[0] + " " + split_names[-1].split(" ")[-1],
-                        split_names[1],
-                    ]
-                return [name.strip() for name in split_names]
-
-        # If no explicit separator, try to detect multiple full names
-        # by looking for patterns like multiple last names
-        words = full_name.split(" ")
-        if len(words) >= 4:  # Minimum 4 words needed for 2 full names
-            # Try to find repeated last names
-            last_name = words[-1]
-            for i in range(len(words) - 2, 0, -1):
-                if words[i] == last_name:
-                    return [" ".join(words[:i+1]), " ".join(words[i+1:])]
-
-        # If no pattern found, return as single name
-        return [full_name]
-
-    def normalize_name(self, name):
-        """
-        Normalize name for comparison, handling different formats.
-        """
-        name = str(name).strip()
+        if self.match_cache is not None:
+            self.match_cache.close()
+        try:
+            self.match_cache = PersistentMatchCache(
+                self.match_cache_file,
+                self.address_index,
+                threshold,
+                top_k=top_k,
+                password=self.password_var.get() or None,
+            )
+        except Exception as e:
+            print(f"Could not open match cache, matching without it: {str(e)}")
+            self.match_cache = MatchCache()
+
+    def find_best_matches(self, donor_names, threshold=80, top_k=5):
+        """Find the best matching addresses and the top_k candidates for many donor names at once"""
+        from matching import find_best_matches
+
+        return find_best_matches(
+            donor_names,
+            self.address_index,
+            threshold,
+            cache=self.match_cache,
+            processes=os.cpu_count(),
+            top_k=top_k,
+        )
 
-        # Handle "last_name, first_name" format
-        if "," in name:
-            parts = name.split(",")
-            if len(parts) == 2:
-                last_name = parts[0].strip()
-                first_name = parts[1].strip()
-                return f"{first_name} {last_name}"
+    def rematch_addresses(self, threshold=80, top_k=5):
+        """Re-match the donations affected by a changed address list and refresh the table in place"""
+        from matching import AddressIndex, find_best_matches, update_matches
 
-        return name
+        added = self.address_index.update(self.address_df)
+        if added is None:
+            # Names of existing rows changed, match all donors again
+            self.address_index = AddressIndex(self.address_df)
+            self.matches = find_best_matches(
+                self.matches, self.address_index, threshold, top_k=top_k
+            )
+        else:
+            self.matches, rematched = update_matches(
+                self.matches, self.address_index, added, threshold, top_k=top_k
+            )
+            print(f"Re-matched {len(rematched)} donors against {len(added)} new addresses")
+
+        # The stored results belong to the old address list, keep only manual corrections
+        self.open_match_cache(threshold, top_k)
+        for donor_name, result in self.matches.items():
+            if self.match_cache.peek(donor_name) is None:
+                self.match_cache.put(donor_name, result)
+        self.match_cache.save()
+
+        items = self.tree.get_children()
+        for idx, data in enumerate(self.matched_data):
+            # Manually edited entries and IBAN matches stay as they are
+            if data.get("source") != "name" or data["donor_name"] not in self.matches:
+                continue
 
-    def find_best_match(self, donor_name, threshold=80):
-        """
-        Find the best matching address using fuzzy matching.
-        Handles multiple names and tries various matching strategies.
-        """
-        best_score = 0
-        best_match = None
-        has_best_match = False
-        original_donor_name = donor_name
-        matched_name = None
-
-        # turn posible all caps into regular title format
-        formatted_name = donor_name.title()
-        # normalize "last_name, firstname" format
-        donor_name_normalized = self.normalize_name(formatted_name)
-
-        # Split into potential multiple names
-        donor_names = self.split_multiple_names(donor_name_normalized)
-        print("")
-        if len(donor_names) > 1:
-            print(f"Split '{donor_name_normalized}' into: {donor_names}")
-
-        # Try matching each name individually and combined
-        for name in donor_names:
-            normalized_name = self.normalize_name(name)
-            print(normalized_name)
-
-            for _, row in self.address_df.iterrows():
-                list_name_raw = str(row["Name"])
-                list_name_normalized_raw = self.normalize_name(list_name_raw)
-
-                list_names = self.split_multiple_names(list_name_raw)
-                list_names_normalized = self.split_multiple_names(
-                    list_name_normalized_raw
+            best_match, score, candidates = self.matches[data["donor_name"]]
+            data["candidates"] = candidates
+            fields = self.match_fields(best_match, score)
+            if any(data[key] != value for key, value in fields.items()):
+                data.update(fields)
+                self.tree.item(
+                    items[idx], values=self.table_values(data), tags=self.table_tags(data)
                 )
 
-                for [list_name, list_name_normalized] in zip(
-                    list_names, list_names_normalized
-                ):
-                    # Try different matching combinations
-                    scores = [
-                        fuzz.ratio(name.lower(), list_name.lower()),
-                        fuzz.ratio(normalized_name.lower(), list_name.lower()),
-                        fuzz.ratio(
-                            normalized_name.lower(), list_name_normalized.lower()
-                        ),
-                        fuzz.token_sort_ratio(name.lower(), list_name.lower()),
-                        fuzz.token_sort_ratio(
-                            normalized_name.lower(), list_name_normalized.lower()
-                        ),
-                    ]
-
-                    max_score = max(scores)
-
-                    if max_score > best_score and max_score >= threshold:
-                        best_score = max_score
-                        best_match = row
-                        has_best_match = True
-                        matched_name = name
-
-        if len(donor_names) > 1 and not has_best_match:
-            # If no match found and we have multiple names,
-            # try matching the combined names
-            combined_name = " ".join(donor_names)
-
-            for _, row in self.address_df.iterrows():
-                list_name = str(row["Name"])
-                list_name_normalized = self.normalize_name(list_name)
-
-                scores = [
-                    fuzz.ratio(combined_name.lower(), list_name.lower()),
-                    fuzz.ratio(combined_name.lower(), list_name_normalized.lower()),
-                    fuzz.token_sort_ratio(combined_name.lower(), list_name.lower()),
-                    fuzz.token_sort_ratio(
-                        combined_name.lower(), list_name_normalized.lower()
-                    ),
-                ]
-
-                max_score = max(scores)
-
-                if max_score > best_score and max_score >= threshold:
-                    best_score = max_score
-                    best_match = row
-                    matched_name = combined_name
+    def match_fields(self, best_match, score):
+        """Return the matched_data fields of a match result"""
+        return {
+            "matched_name": best_match["Name"] if best_match is not None else "",
+            "street": best_match["Straße"] if best_match is not None else "",
+            "postal_code": best_match["PLZ"] if best_match is not None else "",
+            "city": best_match["Ort"] if best_match is not None else "",
+            "match_score": f"{score:.1f}" if score > 0 else "0.0",
+        }
 
-        if best_match is not None:
-            print(
-                f"Found match for '{matched_name}' in '{best_match['Name']}' with score {best_score}"
-            )
-            if matched_name != original_donor_name:
-                print(f"Note: Matched using partial name from '{original_donor_name}'")
-        else:
-            print(f"No match found for any name in '{original_donor_name}'")
+    def table_values(self, data):
+        """Return the treeview values of a matched_data entry"""
+        return (
+            data["donor_name"],
+            data["matched_name"],
+            data["street"],
+            data["postal_code"],
+            data["city"],
+            data["amount"],
+            data["date"],
+            data["match_score"],
+            data["purpose"],
+        )
 
-        return best_match, best_score
+    def table_tags(self, data):
+        """Determine the appropriate tag based on match score"""
+        if not data["matched_name"]:
+            return ("unmatched",)
+        elif float(data["match_score"]) < 80:
+            return ("low_score",)
+        elif float(data["match_score"]) < 95:
+            return ("medium_score",)
+        return ()
 
     def update_table(self):
         """Update the treeview with matched data"""
@@ -853,31 +846,11 @@ class DonationReceiptApp:
 
         # Add new items
         for data in self.matched_data:
-            # Determine the appropriate tag based on match score
-            if not data["matched_name"]:
-                tags = ("unmatched",)
-            elif float(data["match_score"]) < 80:
-                tags = ("low_score",)
-            elif float(data["match_score"]) < 95:
-                tags = ("medium_score",)
-            else:
-                tags = ()
-
             self.tree.insert(
                 "",
                 "end",
-                values=(
-                    data["donor_name"],
-                    data["matched_name"],
-                    data["street"],
-                    data["postal_code"],
-                    data["city"],
-                    data["amount"],
-                    data["date"],
-                    data["match_score"],
-                    data["purpose"],
-                ),
-                tags=tags,
+                values=self.table_values(data),
+                tags=self.table_tags(data),
             )
 
         # Configure tag colors
@@ -920,8 +893,10 @@ class DonationReceiptApp:
         # Get current values
         values = self.tree.item(item)["values"]
 
-        # Create edit dialog
-        dialog = EditDialog(self.root, self.address_df, values)
+        # Create edit dialog with the candidates found while matching
+        idx = self.tree.index(item)
+        candidates = self.matched_data[idx].get("candidates") if idx < len(self.matched_data) else None
+        dialog = EditDialog(self.root, self.address_df, values, candidates)
         self.root.wait_window(dialog)
 
         if dialog.result:
@@ -929,15 +904,21 @@ class DonationReceiptApp:
             self.tree.item(item, values=dialog.result)
 
             # Update matched_data
-            idx = self.tree.index(item)
             self.matched_data[idx].update(
                 {
                     "matched_name": dialog.result[1],
                     "street": dialog.result[2],
                     "postal_code": dialog.result[3],
                     "city": dialog.result[4],
+                    "source": "manual",
                 }
             )
+            # Keyed by the name of the bank statement, the dialog replaces its commas
+            self.record_correction(
+                self.matched_data[idx]["donor_name"],
+                dialog.result,
+                self.matched_data[idx].get("iban"),
+            )
 
     def add_new_entry(self):
         """Add a new address entry"""
@@ -960,11 +941,35 @@ class DonationReceiptApp:
                     "date": dialog.result[6],
                     "match_score": dialog.result[7],
                     "purpose": "",
+                    "source": "manual",
                 }
             )
+            self.record_correction(dialog.result[0], dialog.result)
+
+    def record_correction(self, donor_name, values, iban=None):
+        """Remember a manually assigned address for the donor name and the IBAN for the next runs"""
+        import pandas as pd
+
+        matched_name, street, postal_code, city = values[1:5]
+        if self.match_cache is None or not donor_name or not matched_name:
+            return
+        try:
+            self.match_cache.record_iban(
+                iban,
+                pd.Series(
+                    {"Name": matched_name, "Straße": street, "PLZ": postal_code, "Ort": city}
+                ),
+            )
+            self.match_cache.record_correction(
+                donor_name, matched_name, street, postal_code, city
+            )
+        except Exception as e:
+            print(f"Error saving correction to match cache: {str(e)}")
 
     def update_address_file(self):
         """Update the address Excel file with new/modified entries"""
+        import pandas as pd
+
         try:
             # Create a backup of the original file
             backup_path = self.address_file_var.get() + ".backup"
@@ -991,10 +996,22 @@ class DonationReceiptApp:
             if new_entries:
                 # Add new entries to the DataFrame
                 new_df = pd.DataFrame(new_entries)
+                old_address_df, old_matches = self.address_df, self.matches
                 self.address_df = pd.concat(
                     [self.address_df, new_df], ignore_index=True
                 )
 
+                # Only the donations the new entries could match are re-scored,
+                # before the file is written so that both stay in line on errors
+                try:
+                    self.rematch_addresses()
+                except Exception:
+                    from matching import AddressIndex
+
+                    self.address_df, self.matches = old_address_df, old_matches
+                    self.address_index = AddressIndex(old_address_df)
+                    raise
+
                 # Save updated DataFrame to Excel
                 self.address_df.to_excel(self.address_file_var.get(), index=False)
                 messagebox.showinfo(
@@ -1009,8 +1026,17 @@ class DonationReceiptApp:
         except Exception as e:
             messagebox.showerror("Error", f"Error updating address file: {str(e)}")
 
+    def receipt_jobs(self) -> int:
+        """Number of worker processes for generating the receipts, at least one"""
+        try:
+            return max(1, int(self.jobs_var.get()))
+        except ValueError:
+            return 1
+
     def generate_receipts(self):
         """Generate donation receipts for all matched entries"""
+        from receipts import ReceiptPool, RenderContext
+
         if not self.matched_data:
             messagebox.showerror("Error", "No data loaded to generate receipts from.")
             return
@@ -1029,19 +1055,39 @@ class DonationReceiptApp:
             # Create output directory if it doesn't exist
             os.makedirs(output_dir, exist_ok=True)
 
+            # Only generate for matched entries
+            matched = [data for data in self.matched_data if data["matched_name"]]
+
+            if self.collective_var.get():
+                self.generate_collective_receipts(matched, output_dir, template_path)
+                messagebox.showinfo("Success", "Collective receipt generation complete!")
+                return
+
             # Create progress dialog
-            progress_dialog = ProgressDialog(self.root, len(self.matched_data))
+            progress_dialog = ProgressDialog(self.root, len(matched))
+            finished = 0
 
-            for i, data in enumerate(self.matched_data):
-                if data["matched_name"]:  # Only generate for matched entries
+            # Locale and date are resolved once for all receipts
+            render_context = RenderContext()
+
+            # Receipts are rendered in worker processes, logged in the order of the table
+            with ReceiptPool(self.receipt_jobs()) as receipt_pool:
+                for data in matched:
                     try:
-                        self.generate_single_receipt(data, output_dir, template_path)
+                        self.generate_single_receipt(
+                            data, output_dir, template_path, receipt_pool, render_context
+                        )
                     except Exception as e:
                         print(
                             f"Error generating receipt for {data['donor_name']}: {str(e)}"
                         )
-
-                progress_dialog.update(i + 1)
+                        finished += 1
+                    finished = self.log_generated_receipts(
+                        receipt_pool.completed(), progress_dialog, finished
+                    )
+                self.log_generated_receipts(
+                    receipt_pool.completed(wait=True), progress_dialog, finished
+                )
 
             progress_dialog.destroy()
             messagebox.showinfo("Success", "Receipt generation complete!")
@@ -1049,6 +1095,81 @@ class DonationReceiptApp:
         except Exception as e:
             messagebox.showerror("Error", f"Error generating receipts: {str(e)}")
 
+    def generate_collective_receipts(self, matched, output_dir, template_path):
+        """Generate one annual collective receipt per address and year of the matched entries"""
+        from receipts import (
+            CollectiveReceipts,
+            ReceiptPool,
+            RenderContext,
+            load_receipt_template,
+            render_collective_receipt,
+        )
+
+        # Fails right away if the template has no table row to repeat per donation
+        load_receipt_template(template_path, "collective")
+
+        # Group the donations per address and year
+        collective_receipts = CollectiveReceipts()
+        for data in matched:
+            try:
+                collective_receipts.add(
+                    (data["matched_name"], data["street"], data["postal_code"], data["city"]),
+                    data["date"],
+                    float(data["amount"]),
+                    data,
+                )
+            except Exception as e:
+                print(f"Error adding the donation of {data['donor_name']}: {str(e)}")
+
+        progress_dialog = ProgressDialog(self.root, len(collective_receipts))
+        finished = 0
+
+        # Locale and date are resolved once for all receipts
+        render_context = RenderContext()
+
+        with ReceiptPool(self.receipt_jobs()) as receipt_pool:
+            for collective_receipt in collective_receipts:
+                replacements = collective_receipt.replacements(render_context)
+                filename = collective_receipt.filename()
+
+                for key, value in replacements.items():
+                    if len(value) > 50:
+                        messagebox.showwarning(
+                            "Warning",
+                            f"Possible issue in {filename}: Line break in {key} : '{value}'.",
+                        )
+
+                # log the receipt once it is saved
+                dates = sorted(date for date, _, _ in collective_receipt.donations)
+                receipt_data = {
+                    "generation_date": replacements["<<DATUM_HEUTE>>"],
+                    "donor_name": replacements["<<NAME>>"],
+                    "street": replacements["<<STRASSE>>"],
+                    "postal_code": replacements["<<PLZ>>"],
+                    "city": replacements["<<ORT>>"],
+                    "amount": replacements["<<SUMME>>"],
+                    "amount_words": replacements["<<SUMME_WORTE>>"],
+                    "donation_date": f"{dates[0]:%d.%m.%Y} - {dates[-1]:%d.%m.%Y}",
+                    "filename": filename,
+                }
+
+                receipt_pool.submit(
+                    (collective_receipt.items[0], receipt_data),
+                    render_collective_receipt,
+                    template_path,
+                    replacements,
+                    collective_receipt.rows(render_context),
+                    os.path.join(output_dir, filename),
+                )
+                finished = self.log_generated_receipts(
+                    receipt_pool.completed(), progress_dialog, finished
+                )
+            self.log_generated_receipts(
+                receipt_pool.completed(wait=True), progress_dialog, finished
+            )
+
+        progress_dialog.destroy()
+
     def convert_to_pdfs(self):
         """Convert all docs in the docx output directory to PDF files"""
         input_dir = self.output_dir_var.get()
@@ -1078,72 +1199,26 @@ class DonationReceiptApp:
         except Exception as e:
             messagebox.showerror("Error", f"Error converting docs to PDFs: {str(e)}")
 
-    def format_date(self, date_int: int):
-        """
-        Convert date from integer format (DDMMYY) to German date string (DD.MM.YYYY).
-
-        Args:
-            date_int (int): Date as integer in format DDMMYY (e.g., 130125 for 13.01.25)
-        Returns:
-            str: Date in format 'DD.MM.YYYY'
-        """
-        try:
-            # Convert integer to string and pad with leading zeros if necessary
-            date_str = str(date_int)
-            if len(date_str) < 6:
-                date_str = str(date_int).zfill(6)
-            elif len(date_str) == 7:
-                date_str = str(date_int).zfill(8)
-
-            # Extract components
-            day = date_str[:2]
-            month = date_str[2:4]
-            year = date_str[4:]
-
-            # Convert two-digit year to four-digit year
-            year_int = int(year)
-            if year_int < 100:
-                year = f"20{year}"
-
-            # Return formatted date
-            return f"{day}.{month}.{year}"
-
-        except Exception as e:
-            print(f"Error formatting date {date_int}: {str(e)}")
-            return str(date_int)
-
-    def format_date_str(self, date_str: str):
-        """Parse a date string and format it as dd.mm.YYYY."""
-        try:
-            # Use dateutil's parser to handle different formats
-            parsed_date = parser.parse(date_str, dayfirst=True)
-            # Format the date as dd.mm.YYYY
-            formatted_date = parsed_date.strftime("%d.%m.%Y")
-            return formatted_date
-        except ValueError:
-            return "Invalid date format"
-
-    def generate_single_receipt(self, data, output_dir, template_path):
-        """Generate a single donation receipt"""
-        from docx import Document
-        from datetime import datetime
-        import locale
-
-        doc = Document(template_path)
-
-        desired_locales = ["de_DE.UTF-8", "de_DE", "de_de", "German"]
-        for loc in desired_locales:
-            try:
-                locale.setlocale(locale.LC_ALL, loc)
-                break
-            except locale.Error:
-                continue
-        else:
-            print("Warning: Could not set German locale.")
-
-        # Format date
+    def log_generated_receipts(self, completed, progress_dialog, finished):
+        """Log the receipts finished by a ReceiptPool and advance the progress, returns the finished count"""
+        for (data, receipt_data), error in completed:
+            if error is not None:
+                print(f"Error generating receipt for {data['donor_name']}: {str(error)}")
+            else:
+                self.log_receipt(receipt_data)
+            finished += 1
+            progress_dialog.update(finished)
+        return finished
+
+    def generate_single_receipt(
+        self, data, output_dir, template_path, receipt_pool, render_context
+    ):
+        """Generate a single donation receipt in receipt_pool, logged by log_generated_receipts"""
+        from receipts import render_receipt
+
+        # Format date and amount, the amounts in words are cached across the receipts
         donation_date = data["date"]
-        current_date = datetime.now().strftime("%d.%m.%Y")
+        amount_str, amount_words = render_context.format_amount(data["amount"])
 
         # Create replacements dictionary
         replacements = {
@@ -1151,10 +1226,10 @@ class DonationReceiptApp:
             "<<STRASSE>>": data["street"].strip(),
             "<<PLZ>>": str(data["postal_code"]).strip(),
             "<<ORT>>": data["city"].strip(),
-            "<<BETRAG>>": f"{float(data['amount']):.2f}".replace(".", ",") + " EUR",
-            "<<BETRAG_WORTE>>": self.amount_to_words(float(data["amount"])),
+            "<<BETRAG>>": amount_str,
+            "<<BETRAG_WORTE>>": amount_words,
             "<<DATUM_SPENDE>>": donation_date,
-            "<<DATUM_HEUTE>>": current_date,
+            "<<DATUM_HEUTE>>": render_context.generation_date,
         }
 
         for key, value in replacements.items():
@@ -1164,68 +1239,10 @@ class DonationReceiptApp:
                     f"Possible issue in Spendenbescheinigung_{data["matched_name"]}_{donation_date}.docx: Line break in {key} : '{value}'.",
                 )
 
-        def replace_text_in_paragraph(paragraph, replacements):
-            """Helper function to replace text while preserving formatting."""
-            # Store initial formatting
-            runs_formatting = []
-            for run in paragraph.runs:
-                runs_formatting.append(
-                    {
-                        "bold": run.bold,
-                        "italic": run.italic,
-                        "underline": run.underline,
-                        "font.name": run.font.name,
-                        "font.size": run.font.size,
-                        "font.color.rgb": (
-                            run.font.color.rgb if run.font.color else None
-                        ),
-                    }
-                )
-
-            # Get the full paragraph text
-            text = paragraph.text
-
-            # Apply all replacements
-            for key, value in replacements.items():
-                if key in text:
-                    text = text.replace(key, str(value))
-
-            # Clear the paragraph
-            for run in paragraph.runs:
-                run.text = ""
-
-            # Add the new text back with original formatting
-            paragraph.runs[0].text = text
-
-            # Restore formatting
-            for run, formatting in zip(paragraph.runs, runs_formatting):
-                run.bold = formatting["bold"]
-                run.italic = formatting["italic"]
-                run.underline = formatting["underline"]
-                run.font.name = formatting["font.name"]
-                run.font.size = formatting["font.size"]
-                if formatting["font.color.rgb"]:
-                    run.font.color.rgb = formatting["font.color.rgb"]
-
-        # Replace text in all paragraphs
-        for paragraph in doc.paragraphs:
-            if any(key in paragraph.text for key in replacements.keys()):
-                replace_text_in_paragraph(paragraph, replacements)
-
-        # Also check tables if they exist
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for paragraph in cell.paragraphs:
-                        if any(key in paragraph.text for key in replacements.keys()):
-                            replace_text_in_paragraph(paragraph, replacements)
-
-        # Save document
         safe_name = "".join(x for x in data["matched_name"].strip() if x.isalnum())
         filename = f"Spendenbescheinigung_{safe_name}_{donation_date}.docx"
-        doc.save(os.path.join(output_dir, filename))
 
-        # log the receipt
+        # log the receipt once it is saved
         receipt_data = {
                         'generation_date': replacements['<<DATUM_HEUTE>>'],
                         'donor_name': replacements['<<NAME>>'],
@@ -1237,37 +1254,29 @@ class DonationReceiptApp:
                         'donation_date': replacements['<<DATUM_SPENDE>>'],
                         'filename': filename
                     }
-        self.log_receipt(receipt_data)
-
-
-    def amount_to_words(self, amount):
-        """Convert amount to German words"""
-        from num2words import num2words
-        import math
 
-        euros = int(amount)
-        cents = int(round((amount - euros) * 100))
-
-        if euros == 1:
-            euro_str = "ein Euro"
-        else:
-            euro_str = num2words(euros, lang="de") + " Euro"
+        # Save document, the template is parsed once and only its placeholder paragraphs are rewritten
+        receipt_pool.submit(
+            (data, receipt_data),
+            render_receipt,
+            template_path,
+            replacements,
+            os.path.join(output_dir, filename),
+        )
 
-        if cents > 0:
-            cent_str = num2words(cents, lang="de") + " Cent"
-            return f"{euro_str} und {cent_str}"
-        return euro_str
 
     def on_close(self):
         """Action to perform when closing the main window"""
         self.save_config()
+        if self.match_cache is not None:
+            self.match_cache.close()
         root.destroy()
 
 
 class EditDialog(tk.Toplevel):
     """Dialog for editing or adding entries"""
 
-    def __init__(self, parent, address_df, values=None):
+    def __init__(self, parent, address_df, values=None, candidates=None):
         super().__init__(parent)
         self.title("Edit Entry" if values else "Add Entry")
         self.result = None
@@ -1323,9 +1332,40 @@ class EditDialog(tk.Toplevel):
 
             self.entries[field] = entry
 
+        # Suggested matches, scored while loading the data
+        self.candidates = candidates or []
+        if self.candidates:
+            candidate_frame = ttk.LabelFrame(main_frame, text="Suggested Matches", padding="5")
+            candidate_frame.grid(row=len(fields), column=0, columnspan=2, padx=10, sticky="nsew")
+            candidate_frame.grid_columnconfigure(0, weight=1)
+            main_frame.grid_rowconfigure(len(fields), weight=1)
+
+            self.candidate_tree = ttk.Treeview(
+                candidate_frame,
+                columns=("name", "street", "city", "score"),
+                show="headings",
+                selectmode="browse",
+                height=len(self.candidates),
+            )
+            self.candidate_tree.heading("name", text="Name")
+            self.candidate_tree.heading("street", text="Street")
+            self.candidate_tree.heading("city", text="City")
+            self.candidate_tree.heading("score", text="Score")
+            self.candidate_tree.column("score", width=60, anchor="e")
+
+            for candidate, score in self.candidates:
+                self.candidate_tree.insert("", "end", values=(
+                    candidate["Name"],
+                    candidate["Straße"],
+                    candidate["Ort"],
+                    score
+                ))
+            self.candidate_tree.grid(row=0, column=0, sticky="nsew")
+            self.candidate_tree.bind("<<TreeviewSelect>>", self.select_candidate)
+
         # Buttons
         btn_frame = ttk.Frame(main_frame)
-        btn_frame.grid(row=len(fields), column=0, columnspan=3, pady=10)
+        btn_frame.grid(row=len(fields) + 1, column=0, columnspan=3, pady=10)
 
         ttk.Button(btn_frame, text="Search Address List", command=lambda: self.search_address_list(address_df)).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="Save", command=self.save).pack(side=tk.LEFT, padx=5)
@@ -1371,18 +1411,33 @@ class EditDialog(tk.Toplevel):
         self.wait_window(search_dialog)
         
         if search_dialog.selected_address is not None:
-            # Update address fields with selected data
-            self.entries["Matched Name"].delete(0, tk.END)
-            self.entries["Matched Name"].insert(0, search_dialog.selected_address["Name"])
-            
-            self.entries["Street"].delete(0, tk.END)
-            self.entries["Street"].insert(0, search_dialog.selected_address["Straße"])
-            
-            self.entries["Postal Code"].delete(0, tk.END)
-            self.entries["Postal Code"].insert(0, search_dialog.selected_address["PLZ"])
-            
-            self.entries["City"].delete(0, tk.END)
-            self.entries["City"].insert(0, search_dialog.selected_address["Ort"])
+            self.fill_address(search_dialog.selected_address)
+
+    def select_candidate(self, event=None):
+        """Fill the address fields with the clicked suggested match"""
+        selected_items = self.candidate_tree.selection()
+        if not selected_items:
+            return
+
+        candidate, score = self.candidates[self.candidate_tree.index(selected_items[0])]
+        self.fill_address(candidate)
+
+        self.entries["Match Score"].delete(0, tk.END)
+        self.entries["Match Score"].insert(0, f"{score:.1f}")
+
+    def fill_address(self, address):
+        """Update address fields with the selected address"""
+        self.entries["Matched Name"].delete(0, tk.END)
+        self.entries["Matched Name"].insert(0, address["Name"])
+
+        self.entries["Street"].delete(0, tk.END)
+        self.entries["Street"].insert(0, address["Straße"])
+
+        self.entries["Postal Code"].delete(0, tk.END)
+        self.entries["Postal Code"].insert(0, address["PLZ"])
+
+        self.entries["City"].delete(0, tk.END)
+        self.entries["City"].insert(0, address["Ort"])
 
     def save(self):
         """Save the edited values"""
@@ -1649,6 +1704,9 @@ class PdfConvertProgressDialog(tk.Toplevel):
         self.update_idletasks()
 
 if __name__ == "__main__":
+    # Needed for the matching worker processes in the frozen executable
+    multiprocessing.freeze_support()
     root = tk.Tk()
-    app = DonationReceiptApp(root)
+    # --startup-time quits once the window is drawn, see benchmark/bench_startup.py
+    app = DonationReceiptApp(root, measure_startup="--startup-time" in sys.argv)
     root.mainloop()
@@ -0,0 +1,382 @@
+"""
+Loading of the bank statement CSV export, shared by the command line tool and the GUI.
+"""
+import codecs
+import io
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+# Columns of the bank statement and how they are parsed
+BANK_DTYPES = {
+    'Buchungstag': str,
+    'Beguenstigter/Zahlungspflichtiger': str,
+    'Betrag': 'float64',
+    'Verwendungszweck': str,
+    'Kontonummer/IBAN': str,
+}
+BANK_COLUMNS = list(BANK_DTYPES)
+# Columns not every export has, they are filled with empty values
+OPTIONAL_BANK_COLUMNS = ['Verwendungszweck', 'Kontonummer/IBAN']
+# Booking dates as "26.1.2024" or "26.01.24", or as DDMMYY digits that lost
+# their leading zero when the export was edited as numbers, e.g. 90124
+BOOKING_DATE_PATTERN = (r'^(?:(?P<dotted_day>\d{1,2})\.(?P<dotted_month>\d{1,2})\.(?P<dotted_year>\d{4}|\d{2})'
+                        r'|(?P<day>\d{2})(?P<month>\d{2})(?P<year>\d{4}|\d{2}))$')
+# Columns identifying a transaction that is in more than one statement
+TRANSACTION_KEY = ['Buchungstag', 'Beguenstigter/Zahlungspflichtiger', 'Betrag', 'Verwendungszweck']
+# Separator of several statement paths in one text field of the GUI
+PATH_SEPARATOR = ';'
+
+_BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+# Encodings tried in order for files without byte order mark, latin1 decodes anything
+_ENCODINGS = ('utf-8', 'cp1252')
+# Block size when checking the encoding of a streamed file
+_DETECT_BLOCK_SIZE = 1024 * 1024
+
+
+def decode_bank_file(raw):
+    """
+    Decode the raw bytes of a bank CSV file.
+
+    The encoding comes from the byte order mark if there is one, otherwise
+    UTF-8 is tried before the Windows code page of older exports.
+
+    Returns:
+        tuple: (text, encoding)
+    """
+    for bom, encoding in _BOMS:
+        if raw.startswith(bom):
+            return raw.decode(encoding), encoding
+
+    for encoding in _ENCODINGS:
+        try:
+            return raw.decode(encoding), encoding
+        except UnicodeDecodeError:
+            continue
+    return raw.decode('latin1'), 'latin1'
+
+
+def detect_encoding(csv_path):
+    """
+    Find the encoding decode_bank_file would use, without reading the whole file into memory.
+
+    The file is decoded block by block with incremental decoders, one pass
+    for all candidate encodings.
+    """
+    with open(csv_path, 'rb') as file:
+        start = file.read(len(codecs.BOM_UTF8))
+        for bom, encoding in _BOMS:
+            if start.startswith(bom):
+                return encoding
+
+        file.seek(0)
+        decoders = {encoding: codecs.getincrementaldecoder(encoding)() for encoding in _ENCODINGS}
+        while decoders:
+            block = file.read(_DETECT_BLOCK_SIZE)
+            for encoding, decoder in list(decoders.items()):
+                try:
+                    decoder.decode(block, final=not block)
+                except UnicodeDecodeError:
+                    del decoders[encoding]
+            if not block:
+                break
+
+    for encoding in _ENCODINGS:
+        if encoding in decoders:
+            return encoding
+    return 'latin1'
+
+
+def sniff_delimiter(text):
+    """Return the most frequent of the usual delimiters in the header line."""
+    header = text.split('\n', 1)[0]
+    counts = {delimiter: header.count(delimiter) for delimiter in (';', ',', '\t')}
+    delimiter = max(counts, key=counts.get)
+    return delimiter if counts[delimiter] else ','
+
+
+def _read_bank_csv(source, delimiter, chunksize=None):
+    """Parse the bank columns of a CSV text stream, see pandas.read_csv."""
+    return pd.read_csv(
+        source,
+        sep=delimiter,
+        decimal=',',
+        thousands='.',
+        usecols=lambda column: column in BANK_DTYPES,
+        dtype=BANK_DTYPES,
+        chunksize=chunksize,
+    )
+
+
+def _bank_columns(df, encoding):
+    """Check for the required columns and fill the missing optional ones."""
+    missing = [c for c in BANK_COLUMNS if c not in df.columns and c not in OPTIONAL_BANK_COLUMNS]
+    if missing:
+        raise ValueError(f"Bank statement is missing the columns: {', '.join(missing)} "
+                         f"(read with {encoding} encoding)")
+    for column in OPTIONAL_BANK_COLUMNS:
+        if column not in df.columns:
+            df[column] = None
+
+    return df[BANK_COLUMNS]
+
+
+def load_bank_statement(csv_path):
+    """
+    Load a bank CSV export, reading and parsing the file only once.
+
+    Args:
+        csv_path (str): Path to the bank CSV file
+    Returns:
+        pandas.DataFrame: The BANK_COLUMNS of the statement, Betrag as float
+    """
+    with open(csv_path, 'rb') as file:
+        text, encoding = decode_bank_file(file.read())
+
+    return _bank_columns(_read_bank_csv(io.StringIO(text), sniff_delimiter(text)), encoding)
+
+
+def iter_bank_statement(csv_path, chunksize):
+    """
+    Read a bank CSV export in chunks, holding at most one chunk in memory.
+
+    Args:
+        csv_path (str): Path to the bank CSV file
+        chunksize (int): Number of transactions per chunk
+    Yields:
+        pandas.DataFrame: The BANK_COLUMNS of the next transactions, Betrag as float
+    """
+    encoding = detect_encoding(csv_path)
+    with open(csv_path, encoding=encoding, newline='') as file:
+        delimiter = sniff_delimiter(file.readline())
+        file.seek(0)
+        for chunk in _read_bank_csv(file, delimiter, chunksize):
+            yield _bank_columns(chunk, encoding)
+
+
+def parse_booking_dates(dates):
+    """
+    Parse booking dates into datetime64 with vectorized string operations.
+
+    Dates in neither form of BOOKING_DATE_PATTERN are left to the pandas
+    date parser, day first; unreadable dates become NaT.
+
+    Args:
+        dates (pandas.Series): Booking dates as read from the statement
+    Returns:
+        pandas.Series: datetime64 dates with the index of dates
+    """
+    text = dates.astype('string').str.strip()
+
+    # Restore the leading zero of the day, DMMYY and DMMYYYY
+    digits = text.str.fullmatch(r'\d+').fillna(False)
+    length = text.str.len()
+    text = text.mask(digits & (length < 6), text.str.zfill(6))
+    text = text.mask(digits & (length == 7), text.str.zfill(8))
+
+    parts = text.str.extract(BOOKING_DATE_PATTERN)
+    components = pd.DataFrame({
+        unit: pd.to_numeric(parts[f'dotted_{unit}'].fillna(parts[unit])).astype('float64')
+        for unit in ('year', 'month', 'day')
+    })
+    components['year'] = components['year'].mask(components['year'] < 100, components['year'] + 2000)
+    parsed = pd.to_datetime(components, errors='coerce')
+
+    other = text.notna() & components['day'].isna()
+    if other.any():
+        parsed[other] = pd.to_datetime(text[other], dayfirst=True, format='mixed', errors='coerce')
+    return parsed
+
+
+def normalize_transactions(df):
+    """
+    Prepare loaded transactions for matching, once per statement or chunk.
+
+    Betrag becomes a float64 column, Buchungstag datetime64 (see
+    parse_booking_dates), and only the donations, the transactions with a
+    positive amount, are kept.
+
+    Args:
+        df (pandas.DataFrame): Transactions as returned by load_bank_statement
+    Returns:
+        pandas.DataFrame: The donations, with a new index
+    """
+    amounts = pd.to_numeric(df['Betrag'], errors='coerce').astype('float64')
+    donations = df[amounts > 0].assign(Betrag=amounts[amounts > 0])
+    donations['Buchungstag'] = parse_booking_dates(donations['Buchungstag'])
+    return donations.reset_index(drop=True)
+
+
+def expand_bank_paths(paths):
+    """
+    Expand statement paths to the list of CSV files to load.
+
+    A directory stands for the .csv files directly inside it, in name order.
+    Paths listed more than once are loaded only once.
+
+    Args:
+        paths (list): Paths of CSV files or directories
+    Returns:
+        list: Paths of the CSV files
+    """
+    csv_paths = []
+    seen = set()
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                     if name.lower().endswith('.csv') and os.path.isfile(os.path.join(path, name))]
+        else:
+            files = [path]
+        for file in files:
+            if os.path.abspath(file) not in seen:
+                seen.add(os.path.abspath(file))
+                csv_paths.append(file)
+    return csv_paths
+
+
+def drop_overlapping_transactions(statements):
+    """
+    Concatenate statements, dropping transactions that are in more than one of them.
+
+    Exports with overlapping date ranges contain the same transactions twice.
+    A transaction is identified by TRANSACTION_KEY together with its
+    occurrence number within its own statement, so identical transfers on the
+    same day are kept as often as the statement with the most of them has them.
+
+    Args:
+        statements (list): DataFrames returned by load_bank_statement, at least one
+    Returns:
+        pandas.DataFrame: The transactions in statement order, with a new index
+    """
+    seen = set()
+    frames = []
+    for df in statements:
+        occurrences = {}
+        frames.append(df[_unseen_transactions(df, seen, occurrences)])
+        _remember_transactions(seen, occurrences)
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def _unseen_transactions(df, seen, occurrences, overlapping=None):
+    """
+    Return a mask of the transactions of df not in an earlier statement.
+
+    Args:
+        df (pandas.DataFrame): Transactions, the whole statement or its next chunk
+        seen (set): (key, occurrence) of the transactions of earlier statements
+        occurrences (dict): Count of every key in the statement so far, updated
+        overlapping (list): False for the transactions no other statement can
+            contain, they are kept without being counted; None counts all
+    Returns:
+        list: True for the transactions to keep
+    """
+    keep = []
+    keys = zip(*(df[column] for column in TRANSACTION_KEY))
+    for key, overlaps in zip(keys, overlapping if overlapping is not None else itertools.repeat(True)):
+        if not overlaps:
+            keep.append(True)
+            continue
+        # Missing values are never equal to themselves, None is
+        key = tuple(None if pd.isna(value) else value for value in key)
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+        keep.append((key, occurrence) not in seen)
+    return keep
+
+
+def _remember_transactions(seen, occurrences):
+    """Add the transactions counted for a finished statement to seen."""
+    seen.update((key, occurrence) for key, count in occurrences.items() for occurrence in range(count))
+
+
+def _booking_date_range(csv_path, chunksize):
+    """Return the first and last readable booking date of a bank CSV export, read in chunks, None if it has none."""
+    first = last = None
+    for chunk in iter_bank_statement(csv_path, chunksize):
+        dates = parse_booking_dates(chunk['Buchungstag']).dropna()
+        if len(dates):
+            first = dates.min() if first is None else min(first, dates.min())
+            last = dates.max() if last is None else max(last, dates.max())
+    return first, last
+
+
+def _within_date_ranges(dates, date_ranges):
+    """Return a mask of the booking dates within any of the (first, last) ranges, unreadable dates always are."""
+    mask = dates.isna()
+    for first, last in date_ranges:
+        if first is not None:
+            mask |= (dates >= first) & (dates <= last)
+    return mask.tolist()
+
+
+def load_bank_statements(paths, workers=None):
+    """
+    Load several bank CSV exports in parallel and merge them.
+
+    Args:
+        paths (list): Paths of CSV files or directories of them, see expand_bank_paths
+        workers (int): Number of threads parsing the files, None for the default
+    Returns:
+        tuple: (transactions without duplicates from overlapping statements,
+            number of files, number of dropped duplicates)
+    """
+    csv_paths = expand_bank_paths(paths)
+    if not csv_paths:
+        raise ValueError(f"No bank statement files found in: {', '.join(paths)}")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        statements = list(executor.map(load_bank_statement, csv_paths))
+
+    df = drop_overlapping_transactions(statements)
+    return df, len(csv_paths), sum(map(len, statements)) - len(df)
+
+
+def iter_bank_statements(paths, chunksize):
+    """
+    Stream the transactions of several bank CSV exports in chunks.
+
+    The files are read one after the other. With several files, the
+    transactions repeated by overlapping statements are dropped as
+    load_bank_statements does. Only transactions can be repeated whose
+    booking date is within the date range of another file, so the files'
+    date ranges are read first and only the keys of these transactions are
+    kept, each for as long as a file covering its date is still to come.
+    The memory use grows with the number of transactions in the overlapping
+    date ranges, not with the size of the files.
+
+    Args:
+        paths (list): Paths of CSV files or directories of them, see expand_bank_paths
+        chunksize (int): Number of transactions per chunk
+    Yields:
+        pandas.DataFrame: The next transactions not seen before
+    """
+    csv_paths = expand_bank_paths(paths)
+    if not csv_paths:
+        raise ValueError(f"No bank statement files found in: {', '.join(paths)}")
+
+    deduplicate = len(csv_paths) > 1
+    date_ranges = [_booking_date_range(csv_path, chunksize) for csv_path in csv_paths] if deduplicate else []
+    seen = set()
+    for i, csv_path in enumerate(csv_paths):
+        occurrences = {}
+        if deduplicate:
+            # Transactions of earlier files outside the dates of the remaining files cannot be repeated anymore
+            entries = list(seen)
+            dates = parse_booking_dates(pd.Series([key[0] for key, _ in entries], dtype=object))
+            seen = {entry for entry, keep in zip(entries, _within_date_ranges(dates, date_ranges[i:])) if keep}
+            other_ranges = date_ranges[:i] + date_ranges[i + 1:]
+
+        for chunk in iter_bank_statement(csv_path, chunksize):
+            if deduplicate:
+                overlapping = _within_date_ranges(parse_booking_dates(chunk['Buchungstag']), other_ranges)
+                chunk = chunk[_unseen_transactions(chunk, seen, occurrences, overlapping)]
+            if len(chunk):
+                yield chunk
+        _remember_transactions(seen, occurrences)
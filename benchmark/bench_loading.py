@@ -0,0 +1,110 @@
+"""
+Benchmark loading the address workbook.
+
+Compares the previous full-mode loader, which builds a dict per row, with the
+streaming read-only loader, for load time and peak Python memory. The
+workbook is generated with synthetic addresses plus a few unused columns.
+
+Usage:
+    python benchmark/bench_loading.py [--rows 40000] [--password secret]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import openpyxl
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from addresses import decrypt_workbook, read_address_sheet
+from bench_matching import synthetic_addresses
+
+
+def write_workbook(path, rows):
+    """Write an address workbook with the used and some unused columns."""
+    address_df = synthetic_addresses(rows)
+    address_df['Telefon'] = [f'0170 {i:07d}' for i in range(rows)]
+    address_df['E-Mail'] = [f'spender{i}@example.org' for i in range(rows)]
+    address_df['Bemerkung'] = 'Dauerspender'
+    address_df.to_excel(path, index=False)
+
+
+def encrypt_workbook(path, encrypted_path, password):
+    """Encrypt a workbook with msoffcrypto."""
+    from msoffcrypto.format.ooxml import OOXMLFile
+
+    with open(path, 'rb') as file, open(encrypted_path, 'wb') as encrypted_file:
+        OOXMLFile(file).encrypt(password, encrypted_file)
+
+
+def load_full(workbook_file):
+    """The previous loader: full workbook, a dict of cells per row."""
+    sheet = openpyxl.load_workbook(filename=workbook_file).active
+    headers = [cell.value for cell in sheet[1]]
+    data = []
+    for row in sheet.iter_rows(min_row=2):
+        data.append({header: cell.value for header, cell in zip(headers, row)})
+    return pd.DataFrame(data)
+
+
+def measure(func, *args):
+    """
+    Return (result, seconds, peak traced memory in MB) of func.
+
+    Tracing slows the allocations down, so the time is taken in a separate run.
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark address workbook loading')
+    parser.add_argument('--rows', type=int, default=40000,
+                        help='Number of address rows in the generated workbook')
+    parser.add_argument('--password',
+                        help='Encrypt the generated workbook and include decryption in the timings')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'addresses.xlsx')
+        write_workbook(path, args.rows)
+        if args.password:
+            encrypted_path = os.path.join(tmp_dir, 'addresses_encrypted.xlsx')
+            encrypt_workbook(path, encrypted_path, args.password)
+            path = encrypted_path
+
+        def open_workbook():
+            return decrypt_workbook(path, args.password) if args.password else path
+
+        loaders = [
+            ('full mode, dict per row', lambda: load_full(open_workbook())),
+            ('streaming, all columns', lambda: read_address_sheet(open_workbook(), columns=None)),
+            ('streaming, used columns', lambda: read_address_sheet(open_workbook())),
+        ]
+
+        print(f'{args.rows} rows, {os.path.getsize(path) / 1024 / 1024:.1f} MB'
+              f'{", encrypted" if args.password else ""}\n')
+        reference = None
+        reference_time = None
+        for label, loader in loaders:
+            address_df, seconds, peak = measure(loader)
+            if reference is None:
+                reference, reference_time = address_df, seconds
+            same = address_df.equals(reference[address_df.columns])
+            print(f'{label:<26} {seconds:8.3f}s  {reference_time / seconds:5.1f}x  '
+                  f'peak {peak:8.1f} MB  same data {same}')
+
+
+if __name__ == '__main__':
+    main()
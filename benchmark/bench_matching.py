@@ -0,0 +1,129 @@
+"""
+Benchmark the donor matching strategies on the test data.
+
+Compares the full scan against the blocked candidate search and checks that
+both find the same addresses. The address list can be enlarged with
+synthetic entries to see how the strategies scale.
+
+Usage:
+    python benchmark/bench_matching.py [--extra-addresses 5000]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+import openpyxl
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from matching import AddressIndex, find_best_match, find_best_matches
+
+TEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test')
+
+FIRST_NAMES = [
+    'Alexander', 'Emma', 'Maximilian', 'Sophie', 'Paul', 'Maria', 'Thomas', 'Anna',
+    'Michael', 'Laura', 'Daniel', 'Julia', 'Andreas', 'Sarah', 'Stefan', 'Lena',
+    'Jonas', 'Lukas', 'Mia', 'Hannah', 'Felix', 'Leon', 'Clara', 'Johanna',
+]
+LAST_NAMES = [
+    'Müller', 'Schmidt', 'Schneider', 'Fischer', 'Weber', 'Meyer', 'Wagner', 'Becker',
+    'Schulz', 'Hoffmann', 'Schäfer', 'Koch', 'Bauer', 'Richter', 'Klein', 'Wolf',
+    'Schröder', 'Neumann', 'Schwarz', 'Zimmermann', 'Braun', 'Krüger', 'Hofmann',
+    'Hartmann', 'Lange', 'Schmitt', 'Werner', 'Schmitz', 'Krause', 'Meier',
+]
+
+
+def load_addresses(path):
+    """Load an unencrypted address workbook."""
+    sheet = openpyxl.load_workbook(path, read_only=True).active
+    rows = sheet.iter_rows(values_only=True)
+    headers = next(rows)
+    return pd.DataFrame([dict(zip(headers, row)) for row in rows])
+
+
+def synthetic_addresses(count, seed=0):
+    """Generate random address rows with made-up compound names."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}-{rng.choice(LAST_NAMES)}{i}'
+        rows.append({'Name': name, 'Straße': f'Teststraße {i}', 'PLZ': 10000 + i, 'Ort': 'Teststadt'})
+    return pd.DataFrame(rows)
+
+
+def timed(func, *args, **kwargs):
+    """Run func with its output suppressed and return (result, seconds)."""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def match_each(donor_names, address_index, threshold, **kwargs):
+    """Match the donors one at a time with find_best_match."""
+    return {name: find_best_match(name, address_index, threshold, **kwargs) for name in donor_names}
+
+
+def summarize(matches):
+    """Reduce match results to comparable (row label, score) pairs."""
+    return {
+        name: (row.name if row is not None else None, score)
+        for name, (row, score) in matches.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark donor matching strategies')
+    parser.add_argument('--addresses', default=os.path.join(TEST_DIR, 'test_addresses.xlsx'),
+                        help='Unencrypted address Excel file')
+    parser.add_argument('--bank-csv', default=os.path.join(TEST_DIR, 'test_bank_statement.csv'),
+                        help='Bank CSV file')
+    parser.add_argument('--extra-addresses', type=int, default=5000,
+                        help='Number of synthetic addresses added to the address list')
+    parser.add_argument('--threshold', type=int, default=80,
+                        help='Matching threshold (0-100)')
+    args = parser.parse_args()
+
+    address_df = load_addresses(args.addresses)
+    if args.extra_addresses:
+        address_df = pd.concat([address_df, synthetic_addresses(args.extra_addresses)], ignore_index=True)
+    bank_df = pd.read_csv(args.bank_csv, sep=';', encoding='utf-8-sig', decimal=',')
+    donor_names = list(dict.fromkeys(bank_df['Beguenstigter/Zahlungspflichtiger']))
+
+    address_index, index_time = timed(AddressIndex, address_df)
+    _, ngram_time = timed(address_index.blocking_index, 'ngram')
+    _, phonetic_time = timed(address_index.blocking_index, 'phonetic')
+
+    print(f'{len(donor_names)} unique donors, {len(address_df)} addresses')
+    print(f'Address index built in {index_time:.3f}s, n-gram index in {ngram_time:.3f}s, '
+          f'phonetic index in {phonetic_time:.3f}s\n')
+
+    strategies = [
+        ('find_best_match, full scan', match_each, {}),
+        ('find_best_match, ngram blocking', match_each, {'blocking': 'ngram'}),
+        ('find_best_match, phonetic blocking', match_each, {'blocking': 'phonetic'}),
+        ('find_best_matches, full matrix', find_best_matches, {}),
+        ('find_best_matches, ngram blocking', find_best_matches, {'blocking': 'ngram'}),
+        ('find_best_matches, phonetic blocking', find_best_matches, {'blocking': 'phonetic'}),
+    ]
+
+    reference = None
+    reference_time = None
+    for label, func, kwargs in strategies:
+        matches, seconds = timed(func, donor_names, address_index, args.threshold, **kwargs)
+        matches = summarize(matches)
+        if reference is None:
+            reference, reference_time = matches, seconds
+        differences = sum(matches[name] != reference[name] for name in donor_names)
+        matched = sum(row is not None for row, _ in matches.values())
+        print(f'{label:<36} {seconds:8.3f}s  {reference_time / seconds:7.1f}x  '
+              f'matched {matched}/{len(donor_names)}  differences {differences}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark rendering the receipts.
+
+Compares parsing the template for every receipt, as generate_receipt did
+before, with the compiled ReceiptTemplate and the direct OOXML renderer,
+and checks that all of them write the same document XML.
+
+Usage:
+    python benchmark/bench_rendering.py --template template.docx [--receipts 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from receipts import OoxmlReceiptTemplate, ReceiptTemplate
+from bench_matching import synthetic_addresses
+
+
+def render_parsed_each_time(template_path):
+    """A renderer parsing the template for every receipt."""
+    class Renderer:
+        def render(self, replacements, output_path):
+            ReceiptTemplate(template_path).render(replacements, output_path)
+    return Renderer()
+
+
+def receipt_replacements(count):
+    """Placeholder values of synthetic receipts."""
+    addresses = synthetic_addresses(count)
+    return [{
+        '<<NAME>>': row['Name'],
+        '<<STRASSE>>': row['Straße'],
+        '<<PLZ>>': str(row['PLZ']),
+        '<<ORT>>': row['Ort'],
+        '<<BETRAG>>': f'{i + 1},50 EUR',
+        '<<BETRAG_WORTE>>': 'Betrag in Worten',
+        '<<DATUM_SPENDE>>': '26.01.2024',
+        '<<DATUM_HEUTE>>': '31.12.2024',
+    } for i, row in enumerate(addresses.to_dict('records'))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark receipt rendering')
+    parser.add_argument('--template', required=True,
+                        help='Path to Word template file')
+    parser.add_argument('--receipts', type=int, default=200,
+                        help='Number of receipts rendered per renderer')
+    args = parser.parse_args()
+
+    receipts = receipt_replacements(args.receipts)
+    renderers = [
+        ('template parsed per receipt', lambda: render_parsed_each_time(args.template)),
+        ('compiled python-docx template', lambda: ReceiptTemplate(args.template)),
+        ('direct OOXML', lambda: OoxmlReceiptTemplate(args.template)),
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        reference = None
+        reference_time = None
+        for n, (label, create) in enumerate(renderers):
+            start = time.perf_counter()
+            renderer = create()
+            paths = []
+            for i, replacements in enumerate(receipts):
+                path = os.path.join(tmp_dir, f'{n}_{i}.docx')
+                renderer.render(replacements, path)
+                paths.append(path)
+            seconds = time.perf_counter() - start
+
+            documents = []
+            for path in paths:
+                with zipfile.ZipFile(path) as archive:
+                    documents.append(archive.read('word/document.xml'))
+            if reference is None:
+                reference, reference_time = documents, seconds
+            differences = sum(a != b for a, b in zip(documents, reference))
+            print(f'{label:<30} {seconds:8.3f}s  {seconds / len(receipts) * 1000:7.2f} ms/receipt  '
+                  f'{reference_time / seconds:6.1f}x  differences {differences}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark the startup of the GUI.
+
+Measures, each in fresh processes, the time to import app.py and, when a
+display is available, the time until the main window is drawn. The window
+time is taken from the line app.py prints with --startup-time and from the
+wall clock of the launching process, which also covers the unpacking of the
+onefile executable. Keep the output of each release to track the startup.
+
+Usage:
+    python benchmark/bench_startup.py [--runs 5] [--app app.py] [--command dist/DonationReceiptGenerator.exe]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+STARTUP_LINE = 'Startup time to first window:'
+
+
+def import_seconds(app_path):
+    """Return the seconds a fresh interpreter takes to import the app module."""
+    app_dir, app_file = os.path.split(os.path.abspath(app_path))
+    code = (f'import sys, time; sys.path.insert(0, {app_dir!r}); start = time.perf_counter(); '
+            f'import {os.path.splitext(app_file)[0]}; print(time.perf_counter() - start)')
+    output = subprocess.run([sys.executable, '-c', code], cwd=app_dir, capture_output=True,
+                            text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def first_window_seconds(command, cwd):
+    """
+    Start the app with --startup-time and return (wall clock seconds, reported seconds).
+
+    The wall clock runs from starting the process to the line reporting the
+    drawn window, the reported time from the start of app.py to the drawing.
+    """
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    start = time.perf_counter()
+    process = subprocess.Popen(command + ['--startup-time'], cwd=cwd, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    wall = reported = None
+    for line in process.stdout:
+        if line.startswith(STARTUP_LINE):
+            wall = time.perf_counter() - start
+            reported = float(line[len(STARTUP_LINE):].strip().rstrip('s'))
+    process.wait()
+    if wall is None:
+        raise RuntimeError(f'{" ".join(command)} did not report its startup time')
+    return wall, reported
+
+
+def has_display():
+    """Tell whether Tk can open a window here."""
+    import tkinter
+
+    try:
+        tkinter.Tk().destroy()
+        return True
+    except tkinter.TclError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the GUI startup')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Number of runs, the median is reported')
+    parser.add_argument('--app', default=os.path.join(ROOT_DIR, 'app.py'),
+                        help='app.py to measure, e.g. of an older release')
+    parser.add_argument('--command', nargs='+',
+                        help='Command starting the app instead of app.py, e.g. the built executable')
+    args = parser.parse_args()
+
+    app_dir = os.path.dirname(os.path.abspath(args.app))
+    command = args.command or [sys.executable, os.path.abspath(args.app)]
+
+    if not args.command:
+        seconds = [import_seconds(args.app) for _ in range(args.runs)]
+        print(f'import app               {statistics.median(seconds):8.3f}s  '
+              f'(min {min(seconds):.3f}s, max {max(seconds):.3f}s)')
+
+    if not has_display():
+        print('No display available, skipping the time to the first window')
+        return
+
+    results = [first_window_seconds(command, app_dir) for _ in range(args.runs)]
+    walls, reported = zip(*results)
+    print(f'first window, wall clock {statistics.median(walls):8.3f}s  '
+          f'(min {min(walls):.3f}s, max {max(walls):.3f}s)')
+    print(f'first window, reported  {statistics.median(reported):8.3f}s  '
+          f'(min {min(reported):.3f}s, max {max(reported):.3f}s)')
+
+
+if __name__ == '__main__':
+    main()
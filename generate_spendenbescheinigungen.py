@@ -1,20 +1,15 @@
 import pandas as pd
-from thefuzz import fuzz
-from docx import Document
-from num2words import num2words
-from datetime import datetime
-import locale
 import argparse
 import os
-import math
-import io
-import msoffcrypto
-import openpyxl
 import csv
 import time
 # from docx2pdf import convert
 from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
+from addresses import load_indexed_addresses
+from bank_statements import iter_bank_statements, load_bank_statements, normalize_transactions
+from matching import MatchCache, PersistentMatchCache, find_best_matches, normalize_iban
+from receipts import CollectiveReceipts, ReceiptPool, RenderContext, load_receipt_template
 
 def convert_to_pdf(docx_path, output_dir):
     """
@@ -81,345 +76,112 @@ def batch_convert_to_pdf(output_dir):
     
     return successful, failed
 
-def load_and_prepare_bank_data(csv_path):
-    """Load bank CSV file and extract relevant columns with proper encoding handling."""
-    encodings = ['utf-8', 'iso-8859-1', 'cp1252', 'latin1']
-    
-    for encoding in encodings:
-        try:
-            with open(csv_path, 'r', encoding=encoding) as file:
-                first_line = file.readline()
-                delimiter = ';' if ';' in first_line else ','
-            
-            df = pd.read_csv(csv_path, 
-                           sep=delimiter, 
-                           encoding=encoding,
-                           decimal=',',
-                           thousands='.')
-            
-            print(f"Successfully read bank data with {encoding} encoding")
-            return df[['Buchungstag', 'Beguenstigter/Zahlungspflichtiger', 'Betrag']]
-        except UnicodeDecodeError:
-            print(f"Failed to read with {encoding} encoding, trying next...")
-            continue
-        except Exception as e:
-            print(f"Error with {encoding} encoding: {str(e)}")
-            continue
-    
-    raise ValueError("Could not read the CSV file with any of the attempted encodings")
-
-def load_address_data(excel_path, password=None):
+def load_and_prepare_bank_data(csv_paths):
     """
-    Load address data from password-protected Excel file using msoffcrypto.
+    Load the bank CSV files and extract relevant columns, sniffing encoding and delimiter in one pass.
     
     Args:
-        excel_path (str): Path to the Excel file
-        password (str): Password for the protected file
+        csv_paths (list): Paths of bank CSV files or directories of them, parsed in parallel
     Returns:
-        pandas.DataFrame: The loaded address data
+        pandas.DataFrame: The transactions, without duplicates from overlapping statements
     """
-    try:        
-        # Create a BytesIO object for the decrypted content
-        decrypted_workbook = io.BytesIO()
-        
-        # Open and decrypt the file
-        with open(excel_path, 'rb') as file:
-            office_file = msoffcrypto.OfficeFile(file)
-            if password:
-                office_file.load_key(password=password)
-            office_file.decrypt(decrypted_workbook)
-        
-        # Load the decrypted workbook
-        workbook = openpyxl.load_workbook(filename=decrypted_workbook)
-        sheet = workbook.active
-        
-        # Convert to pandas DataFrame
-        data = []
-        headers = []
-        
-        # Get headers from first row
-        for cell in sheet[1]:
-            headers.append(cell.value)
-        
-        # Get data from remaining rows
-        for row in sheet.iter_rows(min_row=2):
-            row_data = {}
-            for header, cell in zip(headers, row):
-                row_data[header] = cell.value
-            data.append(row_data)
-        
-        return pd.DataFrame(data)
-        
-    except Exception as e:
-        print(f"Error reading Excel file: {str(e)}")
-        raise
+    df, file_count, duplicates = load_bank_statements(csv_paths)
+    if file_count > 1:
+        print(f"Successfully read {len(df)} bank transactions from {file_count} files "
+              f"({duplicates} duplicates from overlapping statements removed)")
+    else:
+        print(f"Successfully read {len(df)} bank transactions")
+    return df
 
-def split_multiple_names(full_name):
-    """
-    Split a string containing multiple names into separate names.
-    Handles various formats and separators.
+def iter_donations(args):
     """
-    full_name = str(full_name).strip()
+    Yield the donations, the bank transactions with a positive amount, in batches
+    normalized by normalize_transactions.
     
-    # List of possible separators
-    separators = [' Und ', ' und ', ' U. ', ' u. ', ' And ', ' and ', ' & ', ' + ', '   ']
+    With a chunk size, the bank files are streamed in chunks of that many
+    transactions, so memory stays bounded however large the files are and
+    receipts are written before the files are read completely. Otherwise
+    all donations come in one batch.
     
-    # First try explicit separators
-    for sep in separators:
-        if sep in full_name:
-            split_names = full_name.split(sep)
-            if len(split_names[0].split(' ')) == 1:
-                split_names = [split_names[0] + ' ' + split_names[-1].split(' ')[-1], split_names[1]]
-            return [name.strip() for name in split_names]
-    
-    # If no explicit separator, try to detect multiple full names
-    # by looking for patterns like multiple last names
-    words = full_name.split(' ')
-    if len(words) >= 4:  # Minimum 4 words needed for 2 full names
-        # Try to find repeated last names
-        last_name = words[-1]
-        for i in range(len(words)-2, 0, -1):
-            if words[i] == last_name:
-                return [
-                    ' '.join(words[:i]),
-                    ' '.join(words[i:])
-                ]
-    
-    # If no pattern found, return as single name
-    return [full_name]
-
-def normalize_name(name):
-    """
-    Normalize name for comparison, handling different formats.
-    """
-    name = str(name).strip()
-    
-    # Handle "last_name, first_name" format
-    if ',' in name:
-        parts = name.split(',')
-        if len(parts) == 2:
-            last_name = parts[0].strip()
-            first_name = parts[1].strip()
-            return f"{first_name} {last_name}"
-
-    return name
-
-def find_best_match(donor_name, address_df, threshold=80):
-    """
-    Find the best matching address using fuzzy matching.
-    Handles multiple names and tries various matching strategies.
+    Args:
+        args: The parsed command line arguments
+    Yields:
+        pandas.DataFrame: The next donations
     """
-    best_score = 0
-    best_match = None
-    has_best_match = False
-    original_donor_name = donor_name
-    matched_name = None
-
-    # turn posible all caps into regular title format
-    formatted_name = donor_name.title()
-    # normalize "last_name, firstname" format
-    donor_name_normalized = normalize_name(formatted_name)
-    
-    # Split into potential multiple names
-    donor_names = split_multiple_names(donor_name_normalized)
-    print('')
-    if len(donor_names) > 1:
-        print(f"Split '{donor_name_normalized}' into: {donor_names}")
-    
-    # Try matching each name individually and combined
-    for name in donor_names:
-        normalized_name = normalize_name(name)
-        print(normalized_name)
-        
-        for _, row in address_df.iterrows():
-            list_name_raw = str(row['Name'])
-            list_name_normalized_raw = normalize_name(list_name_raw)
-
-            list_names = split_multiple_names(list_name_raw)
-            list_names_normalized = split_multiple_names(list_name_normalized_raw)
-
-            for [list_name, list_name_normalized] in zip(list_names, list_names_normalized):
-                # Try different matching combinations
-                scores = [
-                    fuzz.ratio(name.lower(), list_name.lower()),
-                    fuzz.ratio(normalized_name.lower(), list_name.lower()),
-                    fuzz.ratio(normalized_name.lower(), list_name_normalized.lower()),
-                    fuzz.token_sort_ratio(name.lower(), list_name.lower()),
-                    fuzz.token_sort_ratio(normalized_name.lower(), list_name_normalized.lower())
-                ]
-                
-                max_score = max(scores)
-            
-                if max_score > best_score and max_score >= threshold:
-                    best_score = max_score
-                    best_match = row
-                    has_best_match = True
-                    matched_name = name
-
-    if len(donor_names) > 1 and not has_best_match:
-        # If no match found and we have multiple names, 
-        # try matching the combined names
-        combined_name = ' '.join(donor_names)
-        
-        for _, row in address_df.iterrows():
-            list_name = str(row['Name'])
-            list_name_normalized = normalize_name(list_name)
-
-            scores = [
-                fuzz.ratio(combined_name.lower(), list_name.lower()),
-                fuzz.ratio(combined_name.lower(), list_name_normalized.lower()),
-                fuzz.token_sort_ratio(combined_name.lower(), list_name.lower()),
-                fuzz.token_sort_ratio(combined_name.lower(), list_name_normalized.lower())
-            ]
-            
-            max_score = max(scores)
-            
-            if max_score > best_score and max_score >= threshold:
-                best_score = max_score
-                best_match = row
-                matched_name = combined_name
-    
-    if best_match is not None:
-        print(f"Found match for '{matched_name}' in '{best_match['Name']}' with score {best_score}")
-        if matched_name != original_donor_name:
-            print(f"Note: Matched using partial name from '{original_donor_name}'")
+    if args.chunk_size:
+        print("Streaming bank data...")
+        for chunk in iter_bank_statements(args.bank_csv, args.chunk_size):
+            yield normalize_transactions(chunk)
     else:
-        print(f"No match found for any name in '{original_donor_name}'")
-    
-    return best_match, best_score
+        print("Loading bank data...")
+        bank_data = load_and_prepare_bank_data(args.bank_csv)
+        yield normalize_transactions(bank_data)
 
-def format_date(date_int):
+def load_address_data(excel_path, password=None, snapshot_path=None):
     """
-    Convert date from integer format (DDMMYY) to German date string (DD.MM.YYYY).
+    Load address data from an Excel file, decrypted with msoffcrypto if it is password-protected.
     
     Args:
-        date_int (int): Date as integer in format DDMMYY (e.g., 130125 for 13.01.25)
+        excel_path (str): Path to the Excel file
+        password (str): Password for the protected file
+        snapshot_path (str): Encrypted snapshot of the parsed file, None to always parse it
     Returns:
-        str: Date in format 'DD.MM.YYYY'
+        tuple: The loaded address data (pandas.DataFrame) and its AddressIndex
     """
     try:
-        # Convert integer to string and pad with leading zeros if necessary
-        date_str = str(date_int)
-        if len(date_str) < 6:
-          date_str = str(date_int).zfill(6)
-        elif len(date_str) == 7:
-          date_str = str(date_int).zfill(8)
-
-        # Extract components
-        day = date_str[:2]
-        month = date_str[2:4]
-        year = date_str[4:]
-        
-        # Convert two-digit year to four-digit year
-        year_int = int(year)
-        if year_int < 100:
-            year = f"20{year}"
-        
-        # Return formatted date
-        return f"{day}.{month}.{year}"
+        # Decrypt the file if needed and read the used columns in one streaming pass,
+        # or restore both from the snapshot if the file is unchanged
+        return load_indexed_addresses(excel_path, password, snapshot_path=snapshot_path)
         
     except Exception as e:
-        print(f"Error formatting date {date_int}: {str(e)}")
-        return str(date_int)
-
-def amount_to_words(amount) -> str:
-    cents, euros = math.modf(amount)
-
-    if round(euros) == 1:
-        amount_str = 'ein Euro'    
-    else:
-        amount_str = num2words(euros, lang='de') + ' Euro'
-
-    if cents > 0:
-        amount_str += ' und ' + num2words(round(cents * 100), lang='de') + ' Cent'
-
-    return amount_str
+        print(f"Error reading Excel file: {str(e)}")
+        raise
 
-def generate_receipt(template_path, donor_info, amount, transaction_date):
-    """Generate donation receipt from template."""
+def generate_receipt(template_path, donor_info, amount, donation_date, output_path, renderer='docx', context=None):
+    """
+    Generate donation receipt from template and save it to output_path, see load_receipt_template for the renderers.
+    
+    The locale and the date of the run are taken from context, a RenderContext created for the run.
+    """
     try:
-        doc = Document(template_path)
-
-        desired_locales = ['de_DE.UTF-8', 'de_DE', 'de_de', 'German']
-        for loc in desired_locales:
-            try:
-                locale.setlocale(locale.LC_ALL, loc)
-                break
-            except locale.Error:
-                continue
-        else:
-            print("Warning: Could not set German locale.")
+        if context is None:
+            context = RenderContext()
+        amount_str, amount_words = context.format_amount(amount)
         
         replacements = {
             '<<NAME>>': donor_info['Name'].strip(),
             '<<STRASSE>>': donor_info['Straße'].strip(),
             '<<PLZ>>': str(donor_info['PLZ']).strip(),
             '<<ORT>>': donor_info['Ort'].strip(),
-            '<<BETRAG>>': f'{amount:.2f}'.replace('.', ',') + ' EUR',
-            '<<BETRAG_WORTE>>': amount_to_words(amount),
-            '<<DATUM_SPENDE>>': format_date(transaction_date),
-            '<<DATUM_HEUTE>>': datetime.now().strftime('%d.%m.%Y')
+            '<<BETRAG>>': amount_str,
+            '<<BETRAG_WORTE>>': amount_words,
+            '<<DATUM_SPENDE>>': donation_date,
+            '<<DATUM_HEUTE>>': context.generation_date
         }
 
         for key, value in replacements.items():
             if len(value) > 50:
                 print(f" ! WARNING ! Possible line break for {key}: {value}")
         
-        def replace_text_in_paragraph(paragraph, replacements):
-            """Helper function to replace text while preserving formatting."""
-            # Store initial formatting
-            runs_formatting = []
-            for run in paragraph.runs:
-                runs_formatting.append({
-                    'bold': run.bold,
-                    'italic': run.italic,
-                    'underline': run.underline,
-                    'font.name': run.font.name,
-                    'font.size': run.font.size,
-                    'font.color.rgb': run.font.color.rgb if run.font.color else None
-                })
-            
-            # Get the full paragraph text
-            text = paragraph.text
-            
-            # Apply all replacements
-            for key, value in replacements.items():
-                if key in text:
-                    text = text.replace(key, str(value))
-            
-            # Clear the paragraph
-            for run in paragraph.runs:
-                run.text = ""
-            
-            # Add the new text back with original formatting
-            paragraph.runs[0].text = text
-            
-            # Restore formatting
-            for run, formatting in zip(paragraph.runs, runs_formatting):
-                run.bold = formatting['bold']
-                run.italic = formatting['italic']
-                run.underline = formatting['underline']
-                run.font.name = formatting['font.name']
-                run.font.size = formatting['font.size']
-                if formatting['font.color.rgb']:
-                    run.font.color.rgb = formatting['font.color.rgb']
-        
-        # Replace text in all paragraphs
-        for paragraph in doc.paragraphs:
-            if any(key in paragraph.text for key in replacements.keys()):
-                replace_text_in_paragraph(paragraph, replacements)
+        # The template is parsed once, only its placeholder paragraphs are rewritten
+        load_receipt_template(template_path, renderer).render(replacements, output_path)
+    except Exception as e:
+        print(f"Error generating receipt: {str(e)}")
+        raise
+
+def generate_collective_receipt(template_path, collective_receipt, output_path, context):
+    """Generate the annual collective receipt of a CollectiveReceipt and save it to output_path."""
+    try:
+        replacements = collective_receipt.replacements(context)
+        rows = collective_receipt.rows(context)
         
-        # Also check tables if they exist
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for paragraph in cell.paragraphs:
-                        if any(key in paragraph.text for key in replacements.keys()):
-                            replace_text_in_paragraph(paragraph, replacements)
+        for key, value in replacements.items():
+            if len(value) > 50:
+                print(f" ! WARNING ! Possible line break for {key}: {value}")
         
-        return doc
+        load_receipt_template(template_path, 'collective').render(replacements, output_path, rows)
     except Exception as e:
-        print(f"Error generating receipt: {str(e)}")
+        print(f"Error generating collective receipt: {str(e)}")
         raise
 
 def create_receipt_log(file_name, output_dir):
@@ -461,6 +223,29 @@ def log_receipt(log_file, receipt_data):
             receipt_data['filename']
         ])
 
+def log_generated_receipts(log_file, completed):
+    """
+    Log the finished receipts of a ReceiptPool in donation order.
+    
+    Args:
+        log_file (str): Path of the receipt log
+        completed: ReceiptPool.completed() of (donor name, match score, receipt data) items
+    Returns:
+        int: Number of receipts generated
+    """
+    generated = 0
+    for (donor_name, match_score, receipt_data), error in completed:
+        if error is not None:
+            print(f"Error processing donation for {donor_name}: {str(error)}")
+            continue
+        
+        # Log receipt information
+        log_receipt(log_file, receipt_data)
+        
+        print(f'Generated receipt for {donor_name} (match score: {match_score}%)')
+        generated += 1
+    return generated
+
 def process_donations(args):
     """Main function to process all donations and generate receipts."""
     try:
@@ -471,70 +256,141 @@ def process_donations(args):
         log_file = create_receipt_log(args.output_log, args.output_dir)
         
         # Load data
-        print("Loading bank data...")
-        bank_data = load_and_prepare_bank_data(args.bank_csv)
         print("Loading address data...")
-        address_data = load_address_data(args.address_excel, password=args.password)
+        address_data, address_index = load_address_data(args.address_excel, password=args.password,
+                                                        snapshot_path=args.address_snapshot or None)
         
         # Process each donation
         total_processed = 0
         total_matched = 0
         no_matches = []
         
-        print("\nProcessing donations...")
-        for _, donation in bank_data.iterrows():
-            try:
-                if donation['Betrag'] <= 0:
-                    continue
+        blocking = None if args.blocking == 'none' else args.blocking
+        fallback = not args.no_blocking_fallback
+        if args.match_cache:
+            match_cache = PersistentMatchCache(args.match_cache, address_index, args.threshold, blocking, fallback,
+                                               password=args.password)
+        else:
+            match_cache = MatchCache()
 
-                donor_name = donation['Beguenstigter/Zahlungspflichtiger']
-                amount_str = str(donation['Betrag']).replace(',', '.')
-                amount = float(amount_str)
-                transaction_date = donation['Buchungstag']
+        # Receipts are generated in worker processes with --jobs and logged in donation order
+        receipt_pool = ReceiptPool(args.jobs)
+        # Locale and date are resolved once for all receipts of the run
+        render_context = RenderContext()
+        
+        # With --collective the matched donations are grouped per address and year
+        # and rendered as one collective receipt each after the last batch
+        collective_receipts = None
+        if args.collective:
+            load_receipt_template(args.template, 'collective')
+            collective_receipts = CollectiveReceipts()
 
-                # Find matching address
-                donor_info, match_score = find_best_match(donor_name, address_data, args.threshold)
-                
-                if donor_info is not None:
-                    # Generate receipt
-                    receipt = generate_receipt(args.template, donor_info, amount, transaction_date)
-                    
-                    # Generate filename
-                    safe_name = "".join(x for x in donor_info['Name'].strip() if x.isalnum())
-                    filename = f'Spendenbescheinigung_{safe_name}_{format_date(transaction_date)}.docx'
-                    full_path = os.path.join(args.output_dir, filename)
-                    
-                    # Save receipt
-                    receipt.save(full_path)
-                    
-                    # Prepare receipt data for logging
-                    receipt_data = {
-                        'generation_date': datetime.now().strftime('%d.%m.%Y'),
-                        'donor_name': donor_info['Name'].strip(),
-                        'street': donor_info['Straße'].strip(),
-                        'postal_code': str(donor_info['PLZ']).strip(),
-                        'city': donor_info['Ort'].strip(),
-                        'amount': f'{amount:.2f}'.replace('.', ',') + ' EUR',
-                        'amount_words': amount_to_words(amount),
-                        'donation_date': format_date(transaction_date),
-                        'match_score': match_score,
-                        'filename': filename
-                    }
-                    
-                    # Log receipt information
-                    log_receipt(log_file, receipt_data)
+        for donations in iter_donations(args):
+            # Donations from a known IBAN skip the name matching
+            ibans = donations['Kontonummer/IBAN'].map(normalize_iban)
+            iban_matches = match_cache.lookup_ibans(ibans)
+
+            # Match the donors of this batch against the address list at once
+            print(f"\nMatching {len(donations)} donations...")
+            donor_names = donations['Beguenstigter/Zahlungspflichtiger'][~ibans.isin(list(iban_matches))]
+            matches = find_best_matches(donor_names, address_index, args.threshold,
+                                        blocking=blocking, fallback=fallback, cache=match_cache,
+                                        processes=args.workers)
+
+            print("\nProcessing donations...")
+            donation_dates = donations['Buchungstag'].dt.strftime('%d.%m.%Y')
+            for donor_name, amount, donation_date, iban in zip(donations['Beguenstigter/Zahlungspflichtiger'],
+                                                              donations['Betrag'], donation_dates, ibans):
+                try:
+                    if pd.isna(donation_date):
+                        raise ValueError('unreadable booking date')
+
+                    # Find matching address, by IBAN if it is known
+                    if iban in iban_matches:
+                        donor_info, match_score = iban_matches[iban]
+                    else:
+                        donor_info, match_score = matches[donor_name]
+                        if donor_info is not None:
+                            match_cache.record_iban(iban, donor_info, match_score, confirmed=False)
                     
-                    print(f'Generated receipt for {donor_name} (match score: {match_score}%)')
-                    total_matched += 1
-                else:
-                    no_matches.append(donor_name)
+                    if donor_info is not None and collective_receipts is not None:
+                        collective_receipts.add((donor_info['Name'], donor_info['Straße'], donor_info['PLZ'],
+                                                 donor_info['Ort']), donation_date, amount, match_score)
+                        total_matched += 1
+                        total_processed += 1
+                    elif donor_info is not None:
+                        # Generate filename
+                        safe_name = "".join(x for x in donor_info['Name'].strip() if x.isalnum())
+                        filename = f'Spendenbescheinigung_{safe_name}_{donation_date}.docx'
+                        full_path = os.path.join(args.output_dir, filename)
+                        
+                        # Prepare receipt data for logging
+                        amount_str, amount_words = render_context.format_amount(amount)
+                        receipt_data = {
+                            'generation_date': render_context.generation_date,
+                            'donor_name': donor_info['Name'].strip(),
+                            'street': donor_info['Straße'].strip(),
+                            'postal_code': str(donor_info['PLZ']).strip(),
+                            'city': donor_info['Ort'].strip(),
+                            'amount': amount_str,
+                            'amount_words': amount_words,
+                            'donation_date': donation_date,
+                            'match_score': match_score,
+                            'filename': filename
+                        }
+                        
+                        # Generate and save receipt
+                        receipt_pool.submit((donor_name, match_score, receipt_data), generate_receipt, args.template,
+                                            donor_info, amount, donation_date, full_path, args.renderer,
+                                            render_context)
+                    else:
+                        no_matches.append(donor_name)
+                        total_processed += 1
                 
-                total_processed += 1
+                except Exception as e:
+                    print(f"Error processing donation for {donor_name}: {str(e)}")
+                
+                generated = log_generated_receipts(log_file, receipt_pool.completed())
+                total_matched += generated
+                total_processed += generated
             
-            except Exception as e:
-                print(f"Error processing donation for {donor_name}: {str(e)}")
-                continue
+            # Finish the batch before the next one is read
+            generated = log_generated_receipts(log_file, receipt_pool.completed(wait=True))
+            total_matched += generated
+            total_processed += generated
+        
+        total_collective = 0
+        if collective_receipts is not None:
+            print(f"\nGenerating {len(collective_receipts)} collective receipts...")
+            for collective_receipt in collective_receipts:
+                filename = collective_receipt.filename()
+                amount_str, amount_words = render_context.format_amount(collective_receipt.total)
+                dates = sorted(date for date, _, _ in collective_receipt.donations)
+                # The items are the match scores, the lowest one of the listed donations is logged
+                match_score = min(collective_receipt.items)
+                
+                receipt_data = {
+                    'generation_date': render_context.generation_date,
+                    'donor_name': collective_receipt.address[0],
+                    'street': collective_receipt.address[1],
+                    'postal_code': collective_receipt.address[2],
+                    'city': collective_receipt.address[3],
+                    'amount': amount_str,
+                    'amount_words': amount_words,
+                    'donation_date': f'{dates[0]:%d.%m.%Y} - {dates[-1]:%d.%m.%Y}',
+                    'match_score': match_score,
+                    'filename': filename
+                }
+                
+                receipt_pool.submit((collective_receipt.address[0], match_score, receipt_data),
+                                    generate_collective_receipt, args.template, collective_receipt,
+                                    os.path.join(args.output_dir, filename), render_context)
+                total_collective += log_generated_receipts(log_file, receipt_pool.completed())
+            total_collective += log_generated_receipts(log_file, receipt_pool.completed(wait=True))
         
+        receipt_pool.close()
+        match_cache.close()
+
         # TODO: Convert all generated Word documents to PDF; this needs docx2pdf running on WSL
         # successful_conversions, failed_conversions = batch_convert_to_pdf(args.output_dir)
 
@@ -543,6 +399,9 @@ def process_donations(args):
         print(f"Total donations processed: {total_processed}")
         print(f"Successfully matched and generated: {total_matched}")
         print(f"Could not find matches for: {len(no_matches)} donations")
+        if collective_receipts is not None:
+            print(f"Collective receipts generated: {total_collective} of {len(collective_receipts)}")
+        print(match_cache.summary())
         print(f"\nReceipt log saved to: {log_file}")
         
         if no_matches:
@@ -557,8 +416,8 @@ def process_donations(args):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Generate donation receipts from bank data and address list')
     
-    parser.add_argument('--bank-csv', required=True,
-                      help='Path to bank CSV file')
+    parser.add_argument('--bank-csv', required=True, action='append',
+                      help='Path to bank CSV file or a directory of them, repeat for several statements')
     parser.add_argument('--address-excel', required=True,
                       help='Path to address Excel file')
     parser.add_argument('--template', required=True,
@@ -573,6 +432,38 @@ if __name__ == '__main__':
     parser.add_argument('--threshold', type=int,
                       help='Matching threshold (0-100)', 
                       default=80)
+    parser.add_argument('--blocking', choices=['none', 'ngram', 'phonetic'],
+                      help='Only score address names sharing character n-grams (ngram) '
+                           'or Kölner Phonetik codes (phonetic) with the donor name',
+                      default='none')
+    parser.add_argument('--no-blocking-fallback', action='store_true',
+                      help='Do not fall back to a full scan when no blocked candidate reaches the threshold')
+    parser.add_argument('--workers', type=int,
+                      help='Number of worker processes for matching the donors',
+                      default=1)
+    parser.add_argument('--match-cache',
+                      help='SQLite file to keep match results between runs, empty to disable',
+                      default='.donation_receipt_matches.sqlite')
+    parser.add_argument('--address-snapshot',
+                      help='Encrypted snapshot of the parsed address file for faster loading, only written for '
+                           'password protected files, empty to disable',
+                      default='.donation_receipt_addresses.snapshot')
+    parser.add_argument('--jobs', type=int,
+                      help='Number of worker processes generating the receipts',
+                      default=1)
+    parser.add_argument('--renderer', choices=['docx', 'ooxml'],
+                      help='Render the receipts through python-docx (docx) or by writing the '
+                           'document XML and zip archive directly (ooxml, faster for many receipts)',
+                      default='docx')
+    parser.add_argument('--chunk-size', type=int,
+                      help='Stream the bank files in chunks of this many transactions to bound the memory use, '
+                           '0 to load them at once; with several files, their date ranges are read first and '
+                           'the transactions on overlapping dates are remembered to drop duplicates',
+                      default=0)
+    parser.add_argument('--collective', action='store_true',
+                      help='Generate one annual collective receipt (Sammelbestätigung) per address and year '
+                           'instead of one receipt per donation; the template needs a table row with '
+                           '<<DATUM_SPENDE>>, which is repeated for every donation')
     
     args = parser.parse_args()
     
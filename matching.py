@@ -0,0 +1,1359 @@
+import hashlib
+import heapq
+import hmac
+import math
+import multiprocessing
+import os
+import re
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import process, fuzz as rapid_fuzz
+from thefuzz import utils as fuzz_utils
+
+# Smallest number of donors worth sending to a matching worker process
+MIN_DONORS_PER_PROCESS = 50
+
+# Version of the match results stored by PersistentMatchCache, bump it when the matching changes
+MATCH_CACHE_VERSION = 2
+
+# Derivation of the key of the stored IBAN hashes from the workbook password
+IBAN_KEY_SALT_SIZE = 16
+IBAN_KEY_ITERATIONS = 200000
+
+
+def split_multiple_names(full_name):
+    """
+    Split a string containing multiple names into separate names.
+    Handles various formats and separators.
+    """
+    full_name = str(full_name).strip()
+
+    # List of possible separators
+    separators = [' Und ', ' und ', ' U. ', ' u. ', ' And ', ' and ', ' & ', ' + ', '   ']
+
+    # First try explicit separators
+    for sep in separators:
+        if sep in full_name:
+            split_names = full_name.split(sep)
+            if len(split_names[0].split(' ')) == 1:
+                split_names = [split_names[0] + ' ' + split_names[-1].split(' ')[-1], split_names[1]]
+            return [name.strip() for name in split_names]
+
+    # If no explicit separator, try to detect multiple full names
+    # by looking for patterns like multiple last names
+    words = full_name.split(' ')
+    if len(words) >= 4:  # Minimum 4 words needed for 2 full names
+        # Try to find repeated last names
+        last_name = words[-1]
+        for i in range(len(words) - 2, 0, -1):
+            if words[i] == last_name:
+                return [' '.join(words[:i+1]), ' '.join(words[i+1:])]
+
+    # If no pattern found, return as single name
+    return [full_name]
+
+
+def normalize_name(name):
+    """
+    Normalize name for comparison, handling different formats.
+    """
+    name = str(name).strip()
+
+    # Handle "last_name, first_name" format
+    if ',' in name:
+        parts = name.split(',')
+        if len(parts) == 2:
+            last_name = parts[0].strip()
+            first_name = parts[1].strip()
+            return f"{first_name} {last_name}"
+
+    return name
+
+
+# Umlaut transliteration used by canonical_name
+_TRANSLITERATION = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'})
+
+
+def canonical_name(name):
+    """
+    Return the key of a single name for exact matching.
+
+    Case, "last_name, first_name" order, word order, umlauts (ä -> ae,
+    ß -> ss) and punctuation are normalized, so 'MÜLLER, Stefan' and
+    'Stefan Mueller' share the key 'mueller stefan'.
+    """
+    name = normalize_name(name).lower().translate(_TRANSLITERATION)
+    return ' '.join(sorted(re.findall(r'\w+', name)))
+
+
+def split_donor_name(donor_name):
+    """
+    Split a name from the bank statement into the names to match.
+
+    Returns:
+        list: Title-cased, "first_name last_name" ordered names
+    """
+    # turn posible all caps into regular title format
+    formatted_name = donor_name.title()
+    # normalize "last_name, firstname" format
+    return split_multiple_names(normalize_name(formatted_name))
+
+
+def normalize_iban(iban):
+    """Return the IBAN in upper case without spaces, or None for an empty cell."""
+    if not isinstance(iban, str):
+        return None
+    return re.sub(r'\s+', '', iban).upper() or None
+
+
+class MatchCache:
+    """
+    Match results per donor name for the duration of one run.
+
+    Results are stored under the raw donor name and under its split,
+    normalized names, so 'MEYER, THOMAS' reuses the result of 'Thomas Meyer'.
+    The cache assumes the same address list and threshold for every lookup.
+    Addresses of matched or confirmed donations are also kept per IBAN with
+    their match score, so later donations from the same account need no
+    name matching at all.
+    """
+
+    def __init__(self):
+        self.by_name = {}
+        self.by_normalized_name = {}
+        self.by_iban = {}
+        self.hits = 0
+        self.misses = 0
+        # Misses resolved by the exact canonical name lookup
+        self.exact_hits = 0
+        # Donations resolved by their IBAN
+        self.iban_hits = 0
+
+    @staticmethod
+    def normalized_key(donor_name):
+        return tuple(split_donor_name(donor_name))
+
+    def peek(self, donor_name):
+        """Return the cached (row, score) for the donor name or None."""
+        result = self.by_name.get(donor_name)
+        if result is None:
+            result = self.by_normalized_name.get(self.normalized_key(donor_name))
+            if result is not None:
+                self.by_name[donor_name] = result
+        return result
+
+    def get(self, donor_name):
+        """Like peek, but counts the lookup as a hit or miss."""
+        result = self.peek(donor_name)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def put(self, donor_name, result):
+        """Store the (row, score[, candidates]) match result of a donor name."""
+        self.by_name[donor_name] = result
+        self.by_normalized_name[self.normalized_key(donor_name)] = result
+
+    def record_correction(self, donor_name, name, street, postal_code, city):
+        """
+        Remember an address that was assigned to a donor name by hand.
+
+        Args:
+            donor_name (str): Name as it appears on the bank statement
+            name, street, postal_code, city: The corrected address
+        """
+        MatchCache.put(self, donor_name, (pd.Series({'Name': name, 'Straße': street, 'PLZ': postal_code, 'Ort': city}), 100))
+
+    def iban_key(self, iban):
+        """Return the key the address of an IBAN is kept under, the normalized IBAN, None if empty."""
+        return normalize_iban(iban)
+
+    def lookup_ibans(self, ibans):
+        """
+        Look up the addresses of the donations' IBANs.
+
+        Args:
+            ibans (iterable): IBAN of every donation, empty cells are skipped
+        Returns:
+            dict: normalized IBAN -> (address row, score), for the known IBANs only
+        """
+        known = {}
+        for iban in map(normalize_iban, ibans):
+            result = self.by_iban.get(self.iban_key(iban))
+            if result is not None:
+                known[iban] = result
+                self.iban_hits += 1
+        return known
+
+    def record_iban(self, iban, row, score=100, confirmed=True):
+        """
+        Remember the address of a matched or confirmed donation for its IBAN.
+
+        Args:
+            iban (str): IBAN of the donation, ignored if empty
+            row (pandas.Series): Address with 'Name', 'Straße', 'PLZ' and 'Ort'
+            score (float): Score of the match, returned again by lookup_ibans
+            confirmed (bool): Whether the address was confirmed by hand
+                instead of found by matching, see PersistentMatchCache
+        """
+        key = self.iban_key(iban)
+        if key is not None:
+            self.by_iban[key] = (row, score)
+
+    def summary(self):
+        """Return a one-line description of the hit/miss counters."""
+        lookups = self.hits + self.misses
+        ratio = self.hits / lookups * 100 if lookups else 0
+        exact_ratio = self.exact_hits / self.misses * 100 if self.misses else 0
+        return (f"Match cache: {self.hits} hits, {self.misses} misses ({ratio:.1f}% hit rate), "
+                f"exact name matches: {self.exact_hits}/{self.misses} ({exact_ratio:.1f}%), "
+                f"IBAN matches: {self.iban_hits}")
+
+    def close(self):
+        """Release the cache; nothing to do for an in-memory cache."""
+
+
+def _token_sort_process(name):
+    """Preprocess a name the way thefuzz's token_sort_ratio does."""
+    return fuzz_utils.full_process(name, force_ascii=True)
+
+
+def _token_sorted(name):
+    """Return the string token_sort_ratio compares for a name."""
+    return ' '.join(sorted(_token_sort_process(name).split()))
+
+
+def _entry(pos, list_name, list_name_normalized):
+    """Build an index entry of a lowercase list name and its normalized form."""
+    return pos, list_name, list_name_normalized, _token_sorted(list_name), _token_sorted(list_name_normalized)
+
+
+class AddressIndex:
+    """
+    Precomputed name variants of the address list.
+
+    Built once when the address file is loaded, so that matching a donation
+    does not have to split, normalize and lowercase every address row again.
+    """
+
+    def __init__(self, address_df):
+        """
+        Args:
+            address_df (pandas.DataFrame): Address data with at least a 'Name' column
+        """
+        self.address_df = address_df
+
+        # (row position, list name, normalized list name, and both token-sorted
+        # for token_sort_ratio) for every split name
+        self.split_entries = []
+        # (row position, full name, normalized full name, and both token-sorted) for every row
+        self.full_entries = []
+
+        # canonical_name key -> positions of the rows with a split name with that key
+        self.canonical_entries = {}
+        # Candidate indexes for blocked matching, built on first use
+        self._blocking_indexes = {}
+
+        for pos, raw_name in enumerate(address_df['Name']):
+            self._add_row(pos, raw_name)
+
+    def _add_row(self, pos, raw_name):
+        list_name_raw = str(raw_name)
+        list_name_normalized_raw = normalize_name(list_name_raw)
+
+        list_names = split_multiple_names(list_name_raw)
+        list_names_normalized = split_multiple_names(list_name_normalized_raw)
+
+        for list_name, list_name_normalized in zip(list_names, list_names_normalized):
+            self.split_entries.append(_entry(pos, list_name.lower(), list_name_normalized.lower()))
+            for key in (canonical_name(list_name), canonical_name(list_name_normalized)):
+                if key:
+                    positions = self.canonical_entries.setdefault(key, [])
+                    # Rows are added in order, a row may give a key twice
+                    if not positions or positions[-1] != pos:
+                        positions.append(pos)
+
+        self.full_entries.append(_entry(pos, list_name_raw.lower(), list_name_normalized_raw.lower()))
+
+    def __len__(self):
+        return len(self.full_entries)
+
+    def update(self, address_df):
+        """
+        Bring the index up to date with a changed address list.
+
+        Rows appended to the list are indexed incrementally, together with
+        the candidate indexes built so far. Other columns of the existing
+        rows may change, their names may not.
+
+        Args:
+            address_df (pandas.DataFrame): The new address list
+        Returns:
+            list: Positions of the added rows, or None if names of existing
+                rows changed and the index has to be rebuilt
+        """
+        count = len(self.full_entries)
+        old_names = [str(name) for name in self.address_df['Name']]
+        if len(address_df) < count or [str(name) for name in address_df['Name'][:count]] != old_names:
+            return None
+
+        self.address_df = address_df
+        first_entry = len(self.split_entries)
+        added = list(range(count, len(address_df)))
+        for pos in added:
+            self._add_row(pos, address_df['Name'].iloc[pos])
+
+        for blocking_index in self._blocking_indexes.values():
+            for entry_id in range(first_entry, len(self.split_entries)):
+                blocking_index.add(entry_id, self.split_entries[entry_id])
+
+        return added
+
+    def blocking_index(self, blocking):
+        """
+        Return the candidate index for a blocking strategy.
+
+        Args:
+            blocking (str): 'ngram' for the q-gram index, 'phonetic' for the
+                Kölner Phonetik index
+        """
+        if blocking not in self._blocking_indexes:
+            if blocking == 'ngram':
+                self._blocking_indexes[blocking] = NgramIndex(self)
+            elif blocking == 'phonetic':
+                self._blocking_indexes[blocking] = PhoneticIndex(self)
+            else:
+                raise ValueError(f"Unknown blocking strategy: {blocking}")
+        return self._blocking_indexes[blocking]
+
+    def exact_match(self, donor_names):
+        """
+        Look up split donor names by their canonical key.
+
+        Only a key of a single row is an exact match. Rows sharing a key are
+        spelling or word order variants of each other, e.g. 'Müller, Anna'
+        and 'Anna Mueller', and the fuzzy scoring has to pick among them.
+
+        Returns:
+            tuple: (row position, name that matched) of the first name with an
+                exact match, or (None, None) if there is none or the first
+                name found belongs to several rows
+        """
+        for name in donor_names:
+            positions = self.canonical_entries.get(canonical_name(name))
+            if positions is not None:
+                if len(positions) > 1:
+                    return None, None
+                return positions[0], name
+        return None, None
+
+    def row(self, pos):
+        """Return the address row at the given position."""
+        return self.address_df.iloc[pos]
+
+    def fingerprint(self, settings=''):
+        """
+        Return a content hash of the address names and the given settings.
+
+        Matches only depend on the names; the other columns are read from the
+        current rows, so loaders reading different columns share results.
+
+        Args:
+            settings (str): Matching settings the hash should depend on
+        """
+        digest = hashlib.sha256(settings.encode('utf-8'))
+        digest.update(self.address_df['Name'].to_csv(index=False).encode('utf-8'))
+        return digest.hexdigest()
+
+
+class PersistentMatchCache(MatchCache):
+    """
+    MatchCache backed by an SQLite file, so results survive between runs.
+
+    Stored matches and their top-k candidates are reused only while the
+    address list and the matching settings are unchanged. Manual corrections
+    and the IBAN addresses are kept when the address list changes; corrections
+    take precedence over computed matches. IBANs are only stored as HMAC keyed
+    by the workbook password, see iban_key; without a password they are kept
+    for the run only. An IBAN address found by matching is dropped once its
+    name is no longer in the address list, a confirmed one keeps the stored copy.
+    """
+
+    def __init__(self, path, address_index, threshold=80, blocking=None, fallback=True, top_k=0,
+                 password=None):
+        """
+        Args:
+            path (str): Path of the SQLite cache file, created if missing
+            address_index (AddressIndex): Index of the loaded address list
+            threshold, blocking, fallback, top_k: Matching settings the results
+                are computed with, see find_best_matches; results without
+                candidates are not reused for a top_k
+            password (str): Password of the address workbook, the key of the
+                stored IBAN hashes is derived from it
+        """
+        super().__init__()
+        self.address_index = address_index
+        self.fingerprint = address_index.fingerprint(
+            f'{MATCH_CACHE_VERSION}|{threshold}|{blocking}|{fallback}|{top_k}')
+        self.connection = sqlite3.connect(path)
+
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value BLOB)')
+            self.iban_secret = self._iban_secret(password) if password else None
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS matches ('
+                'fingerprint TEXT, donor_name TEXT, row_pos INTEGER, score INTEGER, '
+                'PRIMARY KEY (fingerprint, donor_name))'
+            )
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS match_candidates ('
+                'fingerprint TEXT, donor_name TEXT, rank INTEGER, row_pos INTEGER, score INTEGER, '
+                'PRIMARY KEY (fingerprint, donor_name, rank))'
+            )
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS corrections ('
+                'donor_name TEXT PRIMARY KEY, name TEXT, street TEXT, postal_code TEXT, city TEXT)'
+            )
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS iban_addresses ('
+                'iban_hash TEXT PRIMARY KEY, name TEXT, street TEXT, postal_code TEXT, city TEXT, '
+                'score INTEGER, confirmed INTEGER)'
+            )
+            # Results for another address list or other settings are stale
+            self.connection.execute('DELETE FROM matches WHERE fingerprint != ?', (self.fingerprint,))
+            self.connection.execute('DELETE FROM match_candidates WHERE fingerprint != ?', (self.fingerprint,))
+
+        candidates = {}
+        rows = self.connection.execute(
+            'SELECT donor_name, row_pos, score FROM match_candidates WHERE fingerprint = ? ORDER BY donor_name, rank',
+            (self.fingerprint,)
+        )
+        for donor_name, pos, score in rows:
+            candidates.setdefault(donor_name, []).append((address_index.row(pos), score))
+
+        rows = self.connection.execute(
+            'SELECT donor_name, row_pos, score FROM matches WHERE fingerprint = ?', (self.fingerprint,)
+        )
+        for donor_name, pos, score in rows:
+            result = (address_index.row(pos) if pos is not None else None, score)
+            if donor_name in candidates:
+                result += (candidates[donor_name],)
+            super().put(donor_name, result)
+
+        corrections = self.connection.execute(
+            'SELECT donor_name, name, street, postal_code, city FROM corrections'
+        ).fetchall()
+        ibans = []
+        if self.iban_secret is not None:
+            ibans = self.connection.execute(
+                'SELECT iban_hash, name, street, postal_code, city, score, confirmed FROM iban_addresses'
+            ).fetchall()
+        if corrections or ibans:
+            positions = {}
+            for pos, name in enumerate(address_index.address_df['Name']):
+                positions.setdefault(str(name).strip(), []).append(pos)
+            for donor_name, name, street, postal_code, city in corrections:
+                super().put(donor_name, (self._correction_row(positions, name, street, postal_code, city), 100))
+            for key, name, street, postal_code, city, score, confirmed in ibans:
+                if not confirmed and name not in positions:
+                    continue
+                self.by_iban[key] = (self._correction_row(positions, name, street, postal_code, city), score)
+
+    def _iban_secret(self, password):
+        """Derive the key of the IBAN hashes from the password and the salt of the cache file."""
+        row = self.connection.execute("SELECT value FROM settings WHERE name = 'iban_salt'").fetchone()
+        if row is None:
+            salt = os.urandom(IBAN_KEY_SALT_SIZE)
+            self.connection.execute("INSERT INTO settings VALUES ('iban_salt', ?)", (salt,))
+        else:
+            salt = row[0]
+        return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, IBAN_KEY_ITERATIONS)
+
+    def iban_key(self, iban):
+        """
+        Return the HMAC-SHA256 of the normalized IBAN keyed by the workbook password.
+
+        A plain hash could be reversed by trying the few possible account
+        numbers; without a password the IBAN itself is the key and nothing is stored.
+        """
+        iban = normalize_iban(iban)
+        if iban is None or self.iban_secret is None:
+            return iban
+        return hmac.new(self.iban_secret, iban.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def _correction_row(self, positions, name, street, postal_code, city):
+        """
+        Prefer the current address row of a corrected name over the stored copy.
+
+        Of several rows with the name, the one with the stored address wins,
+        otherwise the first one as in matching.
+        """
+        if name in positions:
+            stored = [str(value).strip() for value in (street, postal_code, city)]
+            for pos in positions[name]:
+                row = self.address_index.row(pos)
+                if [str(row[column]).strip() for column in ('Straße', 'PLZ', 'Ort')] == stored:
+                    return row
+            return self.address_index.row(positions[name][0])
+        return pd.Series({'Name': name, 'Straße': street, 'PLZ': postal_code, 'Ort': city})
+
+    def put(self, donor_name, result):
+        """Store the match result of a donor name, also on disk."""
+        super().put(donor_name, result)
+        row, score = result[:2]
+        pos = self._row_pos(row) if row is not None else None
+        self.connection.execute(
+            'INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?)', (self.fingerprint, donor_name, pos, score)
+        )
+        if len(result) == 3:
+            self.connection.execute(
+                'DELETE FROM match_candidates WHERE fingerprint = ? AND donor_name = ?',
+                (self.fingerprint, donor_name)
+            )
+            self.connection.executemany(
+                'INSERT INTO match_candidates VALUES (?, ?, ?, ?, ?)',
+                [(self.fingerprint, donor_name, rank, self._row_pos(candidate), candidate_score)
+                 for rank, (candidate, candidate_score) in enumerate(result[2])]
+            )
+
+    def _row_pos(self, row):
+        """Return the position of an address row in the address list."""
+        return self.address_index.address_df.index.get_loc(row.name)
+
+    def record_correction(self, donor_name, name, street, postal_code, city):
+        """Remember a manual correction, also on disk for the next runs."""
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO corrections VALUES (?, ?, ?, ?, ?)',
+                (donor_name, name, street, str(postal_code), city)
+            )
+        super().record_correction(donor_name, name, street, postal_code, city)
+
+    def record_iban(self, iban, row, score=100, confirmed=True):
+        """Remember the address of an IBAN, also on disk with the next save if there is a password."""
+        super().record_iban(iban, row, score, confirmed)
+        key = self.iban_key(iban)
+        if key is not None and self.iban_secret is not None:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO iban_addresses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, str(row['Name']).strip(), row['Straße'], str(row['PLZ']), row['Ort'], score, int(confirmed))
+            )
+
+    def save(self):
+        """Write the pending match results to disk."""
+        self.connection.commit()
+
+    def close(self):
+        """Save and close the cache file."""
+        self.save()
+        self.connection.close()
+
+
+def _rank_candidates(keys, postings, max_candidates):
+    """Return the ids of the entries sharing the most keys, in index order."""
+    counts = {}
+    for key in keys:
+        for entry_id in postings.get(key, ()):
+            counts[entry_id] = counts.get(entry_id, 0) + 1
+
+    best = heapq.nsmallest(max_candidates, counts, key=lambda entry_id: (-counts[entry_id], entry_id))
+    return sorted(best)
+
+
+class NgramIndex:
+    """
+    Inverted index from character q-grams to split address names.
+
+    Used to block the fuzzy search: a donor name is only scored against the
+    address names that share the most q-grams with it.
+    """
+
+    def __init__(self, address_index, q=3):
+        """
+        Args:
+            address_index (AddressIndex): Index of the address list
+            q (int): Length of the character grams
+        """
+        self.q = q
+        self.postings = {}
+
+        for entry_id, entry in enumerate(address_index.split_entries):
+            self.add(entry_id, entry)
+
+    def add(self, entry_id, entry):
+        """Add a split entry; ids have to be added in increasing order."""
+        _, list_name, list_name_normalized, _, _ = entry
+        for gram in self.grams(list_name) | self.grams(list_name_normalized):
+            self.postings.setdefault(gram, []).append(entry_id)
+
+    def grams(self, name):
+        """Return the set of padded q-grams of every word in the name."""
+        grams = set()
+        for word in name.split():
+            padded = f' {word} '
+            for i in range(max(1, len(padded) - self.q + 1)):
+                grams.add(padded[i:i + self.q])
+        return grams
+
+    def candidates(self, name, normalized_name, max_candidates=50):
+        """
+        Return the ids of the split entries sharing the most q-grams with
+        the (lowercase) name, in index order.
+        """
+        return _rank_candidates(self.grams(name) | self.grams(normalized_name), self.postings, max_candidates)
+
+
+def cologne_phonetic(word):
+    """
+    Encode a word with the Kölner Phonetik, e.g. 'Müller' and 'Mueller' -> '657'.
+
+    Args:
+        word (str): Single word, case and non-letters are ignored
+    Returns:
+        str: Phonetic code, empty if the word has no letters
+    """
+    word = ''.join(char for char in word.lower() if char.isalpha())
+
+    codes = []
+    for i, char in enumerate(word):
+        prev_char = word[i - 1] if i > 0 else ''
+        next_char = word[i + 1] if i + 1 < len(word) else ''
+
+        if char in 'aeijouyäöü':
+            code = '0'
+        elif char == 'h':
+            continue
+        elif char == 'b':
+            code = '1'
+        elif char == 'p':
+            code = '3' if next_char == 'h' else '1'
+        elif char in 'dt':
+            code = '8' if next_char in ('c', 's', 'z', 'ß') else '2'
+        elif char in 'fvw':
+            code = '3'
+        elif char in 'gkq':
+            code = '4'
+        elif char == 'c':
+            if i == 0:
+                code = '4' if next_char in tuple('ahkloqrux') else '8'
+            elif prev_char in ('s', 'z', 'ß'):
+                code = '8'
+            else:
+                code = '4' if next_char in tuple('ahkoqux') else '8'
+        elif char == 'x':
+            code = '8' if prev_char in ('c', 'k', 'q') else '48'
+        elif char == 'l':
+            code = '5'
+        elif char in 'mn':
+            code = '6'
+        elif char == 'r':
+            code = '7'
+        elif char in 'szß':
+            code = '8'
+        else:
+            continue
+        codes.append(code)
+
+    # Collapse repeated digits, then drop vowels except at the start
+    collapsed = ''
+    for digit in ''.join(codes):
+        if not collapsed or collapsed[-1] != digit:
+            collapsed += digit
+
+    return collapsed[:1] + collapsed[1:].replace('0', '')
+
+
+class PhoneticIndex:
+    """
+    Buckets of split address names by the Kölner Phonetik codes of their words.
+
+    Used to block the fuzzy search: spelling variants of German names like
+    'Schmitt'/'Schmidt' or 'Meyer'/'Meier' land in the same bucket, so a
+    donor name is only scored against the names sharing the most codes.
+    """
+
+    def __init__(self, address_index):
+        """
+        Args:
+            address_index (AddressIndex): Index of the address list
+        """
+        self.buckets = {}
+
+        for entry_id, entry in enumerate(address_index.split_entries):
+            self.add(entry_id, entry)
+
+    def add(self, entry_id, entry):
+        """Add a split entry; ids have to be added in increasing order."""
+        _, list_name, list_name_normalized, _, _ = entry
+        for code in self.codes(list_name) | self.codes(list_name_normalized):
+            self.buckets.setdefault(code, []).append(entry_id)
+
+    @staticmethod
+    def codes(name):
+        """Return the set of phonetic codes of the words in the name."""
+        return {code for code in map(cologne_phonetic, re.split(r'[\s\-]+', name)) if code}
+
+    def candidates(self, name, normalized_name, max_candidates=50):
+        """
+        Return the ids of the split entries sharing the most phonetic codes
+        with the (lowercase) name, in index order.
+        """
+        return _rank_candidates(self.codes(name) | self.codes(normalized_name), self.buckets, max_candidates)
+
+
+def _ratio_bound(len1, len2):
+    """Upper bound of ratio() for two strings of the given lengths."""
+    total = len1 + len2
+    return 200 * min(len1, len2) / total if total else 100
+
+
+def _cascade_score(query, entry, cutoff):
+    """
+    Score a pair of names, skipping the work for pairs that cannot beat cutoff.
+
+    The score is the best of thefuzz's ratio for the names as given and
+    normalized, and its token_sort_ratio. A scorer is skipped if the lengths
+    alone bound its score below the cutoff, the others stop early inside
+    rapidfuzz once they fall below it. Scores above the cutoff are exact,
+    anything else is a score of at most the cutoff.
+
+    Args:
+        query (tuple): (name, normalized name, both token-sorted) of the donor
+        entry (tuple): Index entry of the address name
+        cutoff (int): Score the pair has to beat, -1 scores every pair
+    """
+    name, normalized_name, name_sorted, normalized_name_sorted = query
+    _, list_name, list_name_normalized, list_name_sorted, list_name_normalized_sorted = entry
+
+    # Only raw scores from cutoff + 0.5 on can round to more than the cutoff
+    score_cutoff = max(cutoff + 0.5, 0)
+    # Tolerance for the float error of rapidfuzz's own normalization
+    bound_cutoff = score_cutoff - 1e-6
+
+    score = 0
+    if _ratio_bound(len(name), len(list_name)) >= bound_cutoff:
+        score = max(score, rapid_fuzz.ratio(name, list_name, score_cutoff=score_cutoff))
+    if _ratio_bound(len(normalized_name), len(list_name)) >= bound_cutoff:
+        score = max(score, rapid_fuzz.ratio(normalized_name, list_name, score_cutoff=score_cutoff))
+    if _ratio_bound(len(normalized_name), len(list_name_normalized)) >= bound_cutoff:
+        score = max(score, rapid_fuzz.ratio(normalized_name, list_name_normalized, score_cutoff=score_cutoff))
+    if _ratio_bound(len(name_sorted), len(list_name_sorted)) >= bound_cutoff:
+        score = max(score, rapid_fuzz.token_sort_ratio(name_sorted, list_name_sorted, score_cutoff=score_cutoff))
+    if _ratio_bound(len(normalized_name_sorted), len(list_name_normalized_sorted)) >= bound_cutoff:
+        score = max(score, rapid_fuzz.token_sort_ratio(normalized_name_sorted, list_name_normalized_sorted,
+                                                       score_cutoff=score_cutoff))
+
+    # Rounding is monotonic, so rounding the maximum equals thefuzz's maximum of rounded scores
+    return int(round(score))
+
+
+def _push_candidate(heap, top_k, pos, score):
+    """Keep the top_k best (score, row) pairs in a bounded min-heap."""
+    if pos is None or score <= 0:
+        return
+    item = (score, -pos)
+    if len(heap) < top_k:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
+
+
+def _sorted_candidates(heap):
+    """Return the heap as (row position, score) pairs, best first."""
+    return [(-neg_pos, score) for score, neg_pos in sorted(heap, reverse=True)]
+
+
+def _merge_candidates(candidate_lists, top_k):
+    """Merge (row position, score) lists, keeping the best score per row."""
+    if not top_k:
+        return []
+    scores = {}
+    for candidates in candidate_lists:
+        for pos, score in candidates:
+            if score > scores.get(pos, 0):
+                scores[pos] = score
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+
+
+def _best_entry(name, normalized_name, entries, entry_ids=None, top_k=0, min_score=0):
+    """
+    Score a (lowercase) name against the given index entries.
+
+    Pairs that can neither beat the best score so far nor reach min_score, and
+    with top_k cannot enter the top_k rows either, are cut short by
+    _cascade_score.
+
+    Args:
+        top_k (int): Also collect the best top_k rows in the same pass
+        min_score (int): Scores below this are of no interest; the returned
+            best score is only exact if it reaches min_score
+    Returns:
+        tuple: (row position of the first best entry or None, its score,
+            list of the top_k (row position, score) pairs)
+    """
+    best_score = 0
+    best_pos = None
+    query = (name, normalized_name, _token_sorted(name), _token_sorted(normalized_name))
+
+    # The entries of one row are adjacent, so each row is pushed once with its best score
+    heap = []
+    row_pos = None
+    row_score = 0
+
+    for entry_id in range(len(entries)) if entry_ids is None else entry_ids:
+        entry = entries[entry_id]
+        pos = entry[0]
+
+        # Only a score above the cutoff can change the result
+        cutoff = max(best_score, min_score - 1)
+        if top_k:
+            top_cutoff = row_score if pos == row_pos else 0
+            if len(heap) == top_k:
+                top_cutoff = max(top_cutoff, heap[0][0])
+            cutoff = min(cutoff, top_cutoff)
+
+        score = _cascade_score(query, entry, cutoff)
+        if score > best_score:
+            best_score = score
+            best_pos = pos
+
+        if top_k:
+            if pos != row_pos:
+                _push_candidate(heap, top_k, row_pos, row_score)
+                row_pos = pos
+                row_score = score
+            elif score > row_score:
+                row_score = score
+
+    if top_k:
+        _push_candidate(heap, top_k, row_pos, row_score)
+
+    return best_pos, best_score, _sorted_candidates(heap)
+
+
+def _match_names(donor_names, address_index, threshold, blocking=None, top_k=0):
+    """
+    Match the split donor names against the address index.
+
+    Returns:
+        tuple: (row position or None, score, name that matched,
+            list of the top_k (row position, score) pairs)
+    """
+    best_score = 0
+    best_pos = None
+    matched_name = None
+    candidate_lists = []
+
+    for name in donor_names:
+        name_lower = name.lower()
+        normalized_name_lower = normalize_name(name).lower()
+
+        entry_ids = None
+        if blocking:
+            entry_ids = address_index.blocking_index(blocking).candidates(name_lower, normalized_name_lower)
+
+        pos, score, candidates = _best_entry(name_lower, normalized_name_lower, address_index.split_entries,
+                                             entry_ids, top_k, threshold)
+        candidate_lists.append(candidates)
+        if score > best_score and score >= threshold:
+            best_score = score
+            best_pos = pos
+            matched_name = name
+
+    if len(donor_names) > 1 and best_pos is None:
+        # If no match found and we have multiple names,
+        # try matching the combined names
+        combined_name = ' '.join(donor_names)
+        combined_name_lower = combined_name.lower()
+
+        pos, score, candidates = _best_entry(combined_name_lower, combined_name_lower,
+                                             address_index.full_entries, top_k=top_k, min_score=threshold)
+        candidate_lists.append(candidates)
+        if score >= threshold and pos is not None:
+            best_score = score
+            best_pos = pos
+            matched_name = combined_name
+
+    return best_pos, best_score, matched_name, _merge_candidates(candidate_lists, top_k)
+
+
+def _with_candidates(result, top_k):
+    """Shape a cached (row, score[, candidates]) result for the requested top_k."""
+    if not top_k:
+        return result[:2]
+    return result[:2] + ((result[2] if len(result) == 3 else [])[:top_k],)
+
+
+def find_best_match(donor_name, address_index, threshold=80, blocking=None, fallback=True, cache=None,
+                    top_k=0):
+    """
+    Find the best matching address using fuzzy matching.
+    Handles multiple names and tries various matching strategies.
+    Names with the same canonical_name key as an address name match
+    exactly with score 100 without any fuzzy scoring.
+
+    Args:
+        donor_name (str): Name as it appears on the bank statement
+        address_index (AddressIndex): Index of the address list; a plain
+            DataFrame is indexed on the fly
+        threshold (int): Minimum score (0-100) for a match
+        blocking (str): None to score every address name, 'ngram' or
+            'phonetic' to only score the candidates from that index
+        fallback (bool): Fall back to scoring every address name if no
+            blocked candidate reaches the threshold
+        cache (MatchCache): Optional cache of earlier results in this run
+        top_k (int): Also return the top_k best scoring address rows
+    Returns:
+        tuple: (matched address row or None, match score), with top_k > 0
+            followed by a list of (address row, score) candidates, best first
+    """
+    if cache is not None:
+        cached = cache.get(donor_name)
+        if cached is not None:
+            return _with_candidates(cached, top_k)
+
+    if not isinstance(address_index, AddressIndex):
+        address_index = AddressIndex(address_index)
+
+    original_donor_name = donor_name
+
+    # Split into potential multiple names
+    donor_names = split_donor_name(donor_name)
+    print('')
+    if len(donor_names) > 1:
+        print(f"Split '{normalize_name(donor_name.title())}' into: {donor_names}")
+    for name in donor_names:
+        print(normalize_name(name))
+
+    # Exact matches skip the fuzzy search
+    best_pos, matched_name = address_index.exact_match(donor_names)
+    if best_pos is not None:
+        best_score = 100
+        candidates = [(best_pos, 100)] if top_k else []
+        if cache is not None:
+            cache.exact_hits += 1
+    else:
+        # Try matching each name individually and combined
+        best_pos, best_score, matched_name, candidates = _match_names(
+            donor_names, address_index, threshold, blocking, top_k)
+        if best_pos is None and blocking and fallback:
+            best_pos, best_score, matched_name, candidates = _match_names(
+                donor_names, address_index, threshold, top_k=top_k)
+
+    best_match = address_index.row(best_pos) if best_pos is not None else None
+
+    if best_match is not None:
+        print(f"Found match for '{matched_name}' in '{best_match['Name']}' with score {best_score}")
+        if matched_name != original_donor_name:
+            print(f"Note: Matched using partial name from '{original_donor_name}'")
+    else:
+        print(f"No match found for any name in '{original_donor_name}'")
+
+    result = (best_match, best_score)
+    if top_k:
+        result += ([(address_index.row(pos), score) for pos, score in candidates],)
+
+    if cache is not None:
+        cache.put(donor_name, result)
+
+    return result
+
+
+def _top_rows(scores, rows, top_k):
+    """
+    Return the top_k (row position, score) pairs of every query of a score matrix.
+
+    Args:
+        scores (numpy.ndarray): Rounded scores, one column per address name
+        rows (numpy.ndarray): Row position of every column, non-decreasing
+    """
+    # Reduce the columns of the same row to the best one
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    row_scores = np.maximum.reduceat(scores, starts, axis=1)
+    row_ids = rows[starts]
+
+    k = min(top_k, len(row_ids))
+    kth_scores = -np.partition(-row_scores, k - 1, axis=1)[:, k - 1]
+
+    top = []
+    for query_scores, kth_score in zip(row_scores, kth_scores):
+        # Sort the rows reaching the k-th score, ties by row position
+        selected = np.flatnonzero((query_scores >= kth_score) & (query_scores > 0))
+        order = np.lexsort((row_ids[selected], -query_scores[selected]))[:k]
+        top.append([(int(row_ids[i]), int(query_scores[i])) for i in selected[order]])
+    return top
+
+
+def _best_per_query(names, names_normalized, list_names, list_names_normalized,
+                    workers=-1, chunk_size=512, rows=None, top_k=0, min_score=0):
+    """
+    Score every query against every address name in a few vectorized calls.
+
+    The score of a pair is the maximum of the five scores find_best_match
+    computes for it, rounded like thefuzz does.
+
+    Args:
+        rows (list): Row position of every address name, needed for top_k
+        top_k (int): Also collect the best top_k rows per query
+        min_score (int): Scores below this are of no interest and, without
+            top_k, are cut short by rapidfuzz and reported as 0
+    Returns:
+        tuple: (best position per query, best score per query,
+            list of the top_k (row position, score) pairs per query)
+    """
+    best_pos = np.full(len(names), -1, dtype=np.int64)
+    best_score = np.zeros(len(names), dtype=np.int64)
+    top = [[] for _ in names]
+    if not names or not list_names:
+        return best_pos, best_score, top
+
+    list_names_sorted = [_token_sort_process(n) for n in list_names]
+    list_names_normalized_sorted = [_token_sort_process(n) for n in list_names_normalized]
+    if top_k:
+        rows = np.asarray(rows)
+        score_cutoff = None
+    else:
+        # Raw scores below min_score - 0.5 cannot round up to min_score
+        score_cutoff = max(min_score - 0.5, 0)
+
+    def cdist(queries, choices, scorer):
+        return process.cdist(queries, choices, scorer=scorer, score_cutoff=score_cutoff,
+                             dtype=np.float64, workers=workers)
+
+    # Bound memory by scoring the queries in chunks
+    for start in range(0, len(names), chunk_size):
+        chunk = names[start:start + chunk_size]
+        chunk_normalized = names_normalized[start:start + chunk_size]
+        chunk_sorted = [_token_sort_process(n) for n in chunk]
+        chunk_normalized_sorted = [_token_sort_process(n) for n in chunk_normalized]
+
+        scores = cdist(chunk, list_names, rapid_fuzz.ratio)
+        np.maximum(scores, cdist(chunk_normalized, list_names, rapid_fuzz.ratio), out=scores)
+        np.maximum(scores, cdist(chunk_normalized, list_names_normalized, rapid_fuzz.ratio), out=scores)
+        np.maximum(scores, cdist(chunk_sorted, list_names_sorted, rapid_fuzz.token_sort_ratio), out=scores)
+        np.maximum(scores, cdist(chunk_normalized_sorted, list_names_normalized_sorted,
+                                 rapid_fuzz.token_sort_ratio), out=scores)
+
+        # Round before argmax so ties resolve to the first row, as in the loop
+        scores = np.round(scores)
+        pos = scores.argmax(axis=1)
+        best_pos[start:start + len(chunk)] = pos
+        best_score[start:start + len(chunk)] = scores[np.arange(len(chunk)), pos]
+        if top_k:
+            top[start:start + len(chunk)] = _top_rows(scores, rows, top_k)
+
+    return best_pos, best_score, top
+
+
+def _batch_split_pass(donors, split_donor_names, address_index, threshold, workers, blocking=None, top_k=0):
+    """
+    Match the split names of many donors at once.
+
+    Returns:
+        dict: donor name -> (row position or None, score, top_k candidates)
+    """
+    queries = []
+    queries_normalized = []
+    for donor_name in donors:
+        for name in split_donor_names[donor_name]:
+            queries.append(name.lower())
+            queries_normalized.append(normalize_name(name).lower())
+
+    if blocking:
+        # Blocked queries only have a few candidates each, score them directly
+        blocking_index = address_index.blocking_index(blocking)
+        query_results = [
+            _best_entry(name, normalized_name, address_index.split_entries,
+                        blocking_index.candidates(name, normalized_name), top_k, threshold)
+            for name, normalized_name in zip(queries, queries_normalized)
+        ]
+    else:
+        best_pos, best_score, top = _best_per_query(
+            queries, queries_normalized,
+            [entry[1] for entry in address_index.split_entries],
+            [entry[2] for entry in address_index.split_entries],
+            workers=workers,
+            rows=[entry[0] for entry in address_index.split_entries],
+            top_k=top_k,
+            min_score=threshold,
+        )
+        query_results = [
+            (address_index.split_entries[pos][0] if score > 0 else None, int(score), candidates)
+            for pos, score, candidates in zip(best_pos, best_score, top)
+        ]
+
+    results = {}
+    query = 0
+    for donor_name in donors:
+        donor_score = 0
+        donor_pos = None
+        candidate_lists = []
+        for _ in split_donor_names[donor_name]:
+            pos, score, candidates = query_results[query]
+            candidate_lists.append(candidates)
+            if score > donor_score and score >= threshold:
+                donor_score = score
+                donor_pos = pos
+            query += 1
+        results[donor_name] = (donor_pos, donor_score, _merge_candidates(candidate_lists, top_k))
+
+    return results
+
+
+def _batch_combined_pass(donors, split_donor_names, address_index, threshold, workers, top_k=0):
+    """
+    Match the combined names of donors with several names that had no match.
+
+    Returns:
+        dict: donor name -> (row position or None, score, top_k candidates)
+    """
+    combined_names = [' '.join(split_donor_names[n]).lower() for n in donors]
+    full_pos, full_score, top = _best_per_query(
+        combined_names, combined_names,
+        [entry[1] for entry in address_index.full_entries],
+        [entry[2] for entry in address_index.full_entries],
+        workers=workers,
+        rows=[entry[0] for entry in address_index.full_entries],
+        top_k=top_k,
+        min_score=threshold,
+    )
+
+    results = {}
+    for donor_name, pos, score, candidates in zip(donors, full_pos, full_score, top):
+        if score >= threshold and score > 0:
+            results[donor_name] = (address_index.full_entries[pos][0], int(score), candidates)
+        else:
+            results[donor_name] = (None, 0, candidates)
+    return results
+
+
+def _merge_pass(results, pass_results, top_k):
+    """Update results with a later matching pass, merging the candidate lists."""
+    for donor_name, (pos, score, candidates) in pass_results.items():
+        merged = _merge_candidates([results[donor_name][2], candidates], top_k)
+        if pos is not None:
+            results[donor_name] = (pos, score, merged)
+        else:
+            results[donor_name] = results[donor_name][:2] + (merged,)
+
+
+def _match_split_names(split_donor_names, address_index, threshold, workers, blocking=None, fallback=True,
+                       top_k=0):
+    """
+    Match donors whose names are already split.
+
+    Args:
+        split_donor_names (dict): donor name -> list of split names
+    Returns:
+        dict: donor name -> (row position or None, score, top_k candidates)
+    """
+    unique_names = list(split_donor_names)
+
+    results = _batch_split_pass(unique_names, split_donor_names, address_index,
+                                threshold, workers, blocking, top_k)
+
+    # If no match found and we have multiple names, try the combined names
+    unmatched = [n for n in unique_names if results[n][0] is None and len(split_donor_names[n]) > 1]
+    if unmatched:
+        _merge_pass(results, _batch_combined_pass(unmatched, split_donor_names, address_index,
+                                                  threshold, workers, top_k), top_k)
+
+    # Recall safety net for blocked matching: score the rest against everything
+    if blocking and fallback:
+        unmatched = [n for n in unique_names if results[n][0] is None]
+        if unmatched:
+            _merge_pass(results, _batch_split_pass(unmatched, split_donor_names, address_index,
+                                                   threshold, workers, top_k=top_k), top_k)
+
+    return results
+
+
+# Address index of a matching worker process, see _match_in_processes
+_worker_address_index = None
+
+
+def _init_match_worker(address_index=None):
+    """Set the address index of a worker process started without fork."""
+    global _worker_address_index
+    if address_index is not None:
+        _worker_address_index = address_index
+
+
+def _match_worker(task):
+    """Match one chunk of donors in a worker process."""
+    split_donor_names, threshold, blocking, fallback, top_k = task
+    # The processes already use the cores, score with one thread each
+    return _match_split_names(split_donor_names, _worker_address_index, threshold, 1, blocking, fallback, top_k)
+
+
+def _match_in_processes(split_donor_names, address_index, threshold, blocking, fallback, processes, top_k=0):
+    """
+    Split the donors into contiguous chunks and match them in a process pool.
+
+    Forked workers inherit the address index from this process; elsewhere it
+    is pickled once per worker, never per task. The chunks are merged back in
+    their original order.
+    """
+    global _worker_address_index
+
+    # Build the lazy candidate index before the workers copy the address index
+    if blocking:
+        address_index.blocking_index(blocking)
+
+    donor_items = list(split_donor_names.items())
+    chunk_size = math.ceil(len(donor_items) / processes)
+    tasks = [
+        (dict(donor_items[start:start + chunk_size]), threshold, blocking, fallback, top_k)
+        for start in range(0, len(donor_items), chunk_size)
+    ]
+
+    if sys.platform.startswith('linux'):
+        context = multiprocessing.get_context('fork')
+        _worker_address_index = address_index
+        initargs = ()
+    else:
+        context = multiprocessing.get_context()
+        initargs = (address_index,)
+
+    results = {}
+    try:
+        with ProcessPoolExecutor(max_workers=len(tasks), mp_context=context,
+                                 initializer=_init_match_worker, initargs=initargs) as executor:
+            for chunk_results in executor.map(_match_worker, tasks):
+                results.update(chunk_results)
+    finally:
+        _worker_address_index = None
+
+    return results
+
+
+def find_best_matches(donor_names, address_index, threshold=80, workers=-1, blocking=None, fallback=True,
+                      cache=None, processes=None, top_k=0):
+    """
+    Batch version of find_best_match for many donor names at once.
+
+    Every unique donor name is scored against all names of the address index
+    in vectorized rapidfuzz calls. The result is the same as calling
+    find_best_match for each name.
+
+    Args:
+        donor_names (iterable): Names as they appear on the bank statement
+        address_index (AddressIndex): Index of the address list
+        threshold (int): Minimum score (0-100) for a match
+        workers (int): Number of threads for the score matrix, -1 uses all cores
+        blocking (str): None to score every address name, 'ngram' or
+            'phonetic' to only score the candidates from that index
+        fallback (bool): Fall back to scoring every address name for donors
+            without a match among the blocked candidates
+        cache (MatchCache): Optional cache of earlier results in this run;
+            every donor name in donor_names counts as one lookup
+        processes (int): Match in up to this many worker processes, with at
+            least MIN_DONORS_PER_PROCESS donors each; None matches in this process
+        top_k (int): Also return the top_k best scoring address rows
+    Returns:
+        dict: donor name -> (matched address row or None, match score), with
+            top_k > 0 followed by a list of (address row, score) candidates;
+            cached results without stored candidates have none
+    """
+    if not isinstance(address_index, AddressIndex):
+        address_index = AddressIndex(address_index)
+    if cache is None:
+        cache = MatchCache()
+
+    donor_names = [n for n in donor_names if isinstance(n, str)]
+
+    # Only match each spelling of a donor name once, and only if it is not cached
+    split_donor_names = {}
+    for donor_name in dict.fromkeys(donor_names):
+        if cache.peek(donor_name) is None:
+            split_donor_names.setdefault(cache.normalized_key(donor_name), donor_name)
+    unique_names = list(split_donor_names.values())
+
+    # Exact matches skip the fuzzy search
+    results = {}
+    fuzzy_donor_names = {}
+    for key, donor_name in split_donor_names.items():
+        pos, _ = address_index.exact_match(key)
+        if pos is not None:
+            results[donor_name] = (pos, 100, [(pos, 100)] if top_k else [])
+        else:
+            fuzzy_donor_names[donor_name] = list(key)
+    cache.exact_hits += len(results)
+
+    processes = min(processes or 1, len(fuzzy_donor_names) // MIN_DONORS_PER_PROCESS)
+    if processes > 1:
+        results.update(_match_in_processes(fuzzy_donor_names, address_index, threshold,
+                                           blocking, fallback, processes, top_k))
+    elif fuzzy_donor_names:
+        results.update(_match_split_names(fuzzy_donor_names, address_index, threshold,
+                                          workers, blocking, fallback, top_k))
+
+    for donor_name, (pos, score, candidates) in results.items():
+        result = (address_index.row(pos) if pos is not None else None, score)
+        if top_k:
+            result += ([(address_index.row(c_pos), c_score) for c_pos, c_score in candidates],)
+        cache.put(donor_name, result)
+    cache.misses += len(unique_names)
+    cache.hits += len(donor_names) - len(unique_names)
+
+    return {donor_name: _with_candidates(cache.peek(donor_name), top_k) for donor_name in donor_names}
+
+
+def update_matches(matches, address_index, added, threshold=80, workers=-1, top_k=0):
+    """
+    Update the results of find_best_matches after rows were added to the address list.
+
+    Only donors for which an added row reaches the threshold are matched
+    again, against the whole list. For all other donors no added row can
+    change the result; their rows are re-read from the updated list and
+    the added rows are merged into their candidates. The results are the
+    same as matching every donor again without blocking. Results whose row
+    is not in the list, e.g. manual corrections or IBAN matches to a stored
+    address, are fixed and returned unchanged.
+
+    Args:
+        matches (dict): donor name -> result of find_best_matches with the
+            same threshold and top_k, before the rows were added
+        address_index (AddressIndex): Index of the updated address list
+        added (list): Positions of the added rows, see AddressIndex.update
+        threshold (int): Minimum score (0-100) for a match
+        workers (int): Number of threads for the score matrix, -1 uses all cores
+        top_k (int): Number of candidates of the results
+    Returns:
+        tuple: (dict of donor name -> updated result, list of the donor
+            names that were matched again)
+    """
+    address_df = address_index.address_df
+    if not added:
+        return dict(matches), []
+
+    fixed = {donor_name: result for donor_name, result in matches.items()
+             if result[0] is not None and result[0].name not in address_df.index}
+
+    # Score the donors against the added rows only to find the affected ones
+    added_matches = find_best_matches([donor_name for donor_name in matches if donor_name not in fixed],
+                                      AddressIndex(address_df.iloc[added]), threshold, workers, top_k=top_k)
+    rematched = [donor_name for donor_name, result in added_matches.items() if result[0] is not None]
+    results = find_best_matches(rematched, address_index, threshold, workers, top_k=top_k)
+
+    results.update(fixed)
+    for donor_name, (row, score, *candidates) in matches.items():
+        if donor_name in results:
+            continue
+        result = (address_df.loc[row.name] if row is not None else None, score)
+        if top_k:
+            merged = [(address_df.loc[c.name], c_score) for c, c_score in candidates[0]]
+            # Exact matches have no other candidates
+            if address_index.exact_match(split_donor_name(donor_name))[0] is None:
+                # Ties keep the earlier rows, as in a full match
+                merged = sorted(merged + added_matches[donor_name][2], key=lambda candidate: -candidate[1])
+            result += (merged[:top_k],)
+        results[donor_name] = result
+
+    return {donor_name: results[donor_name] for donor_name in matches}, rematched
@@ -0,0 +1,639 @@
+"""
+Rendering of the donation receipts from the Word template, shared by the command line tool and the GUI.
+"""
+import collections
+import copy
+import functools
+import io
+import locale
+import os
+import re
+import struct
+import threading
+import zipfile
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+
+from docx import Document
+from num2words import num2words
+
+# Placeholders in the template, e.g. <<NAME>>
+PLACEHOLDER_PATTERN = re.compile(r'<<[^<>]+>>')
+
+# Stand-ins for the values while compiling an OoxmlReceiptTemplate, from the private use area
+SENTINEL = '\ue000{}\ue001'
+_SENTINEL_TEXT = re.compile('\ue000(\\d+)\ue001')
+_SENTINEL_BYTES = re.compile('\ue000(\\d+)\ue001'.encode('utf-8'))
+# Characters lxml refuses in XML text
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+# python-docx writes these as <w:tab/> and <w:br/> instead of text
+_RUN_BREAKS = re.compile('[\t\r\n]')
+
+# Templates compiled in this process, see load_receipt_template
+_template_cache = {}
+
+# Placeholder marking the table row repeated per donation in a collective receipt template
+ROW_PLACEHOLDER = '<<DATUM_SPENDE>>'
+
+# Locales tried in order for the receipts
+GERMAN_LOCALES = ('de_DE.UTF-8', 'de_DE', 'de_de', 'German')
+
+
+class TemplateSlot:
+    """
+    A paragraph of the template containing placeholders.
+
+    Attributes:
+        location (tuple): ('body', paragraph) or ('table', table, row, cell, paragraph) indices
+        text (str): Text of the paragraph in the template
+        runs_formatting (list): Formatting of the runs of the paragraph, restored after replacing
+    """
+
+    def __init__(self, location, paragraph):
+        self.location = location
+        self.text = paragraph.text
+        self.runs_formatting = [{
+            'bold': run.bold,
+            'italic': run.italic,
+            'underline': run.underline,
+            'font.name': run.font.name,
+            'font.size': run.font.size,
+            'font.color.rgb': run.font.color.rgb if run.font.color else None
+        } for run in paragraph.runs]
+
+    def paragraph(self, document):
+        """Return the paragraph of this slot in a document of the template."""
+        if self.location[0] == 'body':
+            return document.paragraphs[self.location[1]]
+        _, table, row, cell, paragraph = self.location
+        return document.tables[table].rows[row].cells[cell].paragraphs[paragraph]
+
+    def replaced_text(self, replacements):
+        """Return the text of the paragraph with the placeholders replaced one key after the other."""
+        text = self.text
+        for key, value in replacements.items():
+            if key in text:
+                text = text.replace(key, str(value))
+        return text
+
+    def fill(self, document, replacements, paragraph=None):
+        """
+        Replace the placeholders in the paragraph while preserving its formatting.
+
+        Args:
+            paragraph: Paragraph to fill instead of the one of this slot in document, e.g. in a copied table row
+        """
+        text = self.replaced_text(replacements)
+        if paragraph is None:
+            paragraph = self.paragraph(document)
+
+        # Clear the paragraph
+        for run in paragraph.runs:
+            run.text = ''
+
+        # Add the new text back with original formatting
+        paragraph.runs[0].text = text
+
+        # Restore formatting
+        for run, formatting in zip(paragraph.runs, self.runs_formatting):
+            run.bold = formatting['bold']
+            run.italic = formatting['italic']
+            run.underline = formatting['underline']
+            run.font.name = formatting['font.name']
+            run.font.size = formatting['font.size']
+            if formatting['font.color.rgb']:
+                run.font.color.rgb = formatting['font.color.rgb']
+
+
+class ReceiptTemplate:
+    """
+    A Word receipt template parsed once and rendered many times.
+
+    The template is unzipped and parsed once per thread. The paragraphs
+    containing placeholders, in the body and in table cells, are recorded
+    as slots with their text and run formatting. A receipt is rendered by
+    restoring the body of the parsed document from a copy and replacing the
+    text of the slots only, the same way each paragraph was rewritten when
+    the whole document was scanned per receipt.
+    """
+
+    def __init__(self, template_path):
+        with open(template_path, 'rb') as file:
+            self.data = file.read()
+        self._local = threading.local()
+
+        document = self._document()
+        # Zip member of the main document part, usually word/document.xml
+        self.document_member = document.part.partname.membername
+        self.body = [copy.deepcopy(child) for child in document.element.body]
+        self.slots = []
+        seen = set()
+        for i, paragraph in enumerate(document.paragraphs):
+            self._add_slot(('body', i), paragraph, seen)
+        for t, table in enumerate(document.tables):
+            for r, row in enumerate(table.rows):
+                for c, cell in enumerate(row.cells):
+                    for p, paragraph in enumerate(cell.paragraphs):
+                        self._add_slot(('table', t, r, c, p), paragraph, seen)
+
+    def _add_slot(self, location, paragraph, seen):
+        """Record a paragraph with placeholders; merged cells repeat their paragraphs."""
+        if paragraph._p in seen or not PLACEHOLDER_PATTERN.search(paragraph.text):
+            return
+        seen.add(paragraph._p)
+        self.slots.append(TemplateSlot(location, paragraph))
+
+    def _document(self):
+        """Return the parsed template of the current thread."""
+        document = getattr(self._local, 'document', None)
+        if document is None:
+            document = Document(io.BytesIO(self.data))
+            self._local.document = document
+        return document
+
+    def render(self, replacements, output_path):
+        """
+        Write a receipt with the placeholders replaced.
+
+        Args:
+            replacements (dict): Values by placeholder, e.g. {'<<NAME>>': 'Anna Bauer'}
+            output_path: Path or file object of the .docx file to write
+        """
+        self._filled_document(replacements).save(output_path)
+
+    def _filled_document(self, replacements):
+        """Return the parsed document with its body restored from the template and the slots filled."""
+        document = self._document()
+        body = document.element.body
+        for child in list(body):
+            body.remove(child)
+        body.extend(copy.deepcopy(child) for child in self.body)
+
+        for slot in self.slots:
+            if any(key in slot.text for key in replacements.keys()):
+                slot.fill(document, replacements)
+
+        return document
+
+
+class CollectiveReceiptTemplate(ReceiptTemplate):
+    """
+    A template of the annual collective receipt (Sammelbestätigung) of a donor.
+
+    The table row containing ROW_PLACEHOLDER is repeated for every donation
+    and filled with its <<DATUM_SPENDE>>, <<BETRAG>> and <<BETRAG_WORTE>>.
+    The other placeholders are filled once, see CollectiveReceipt.replacements.
+    """
+
+    def __init__(self, template_path):
+        super().__init__(template_path)
+
+        for slot in self.slots:
+            if slot.location[0] == 'table' and ROW_PLACEHOLDER in slot.text:
+                # (table, row) indices of the repeated row
+                self.row_location = slot.location[1:3]
+                break
+        else:
+            raise ValueError(f'The collective receipt template has no table row with {ROW_PLACEHOLDER}')
+
+        # The slots of the repeated row are filled per donation, after the others
+        self.row_slots = [slot for slot in self.slots if slot.location[1:3] == self.row_location]
+        self.slots = [slot for slot in self.slots if slot.location[1:3] != self.row_location]
+
+    def render(self, replacements, output_path, rows=()):
+        """
+        Write a collective receipt with the placeholders replaced.
+
+        Args:
+            replacements (dict): Values by placeholder outside the repeated row
+            output_path: Path or file object of the .docx file to write
+            rows (list): Values by placeholder of each donation, one table row each
+        """
+        document = self._filled_document(replacements)
+        table, row = self.row_location
+        table = document.tables[table]
+        template_row = table.rows[row]._tr
+
+        # The copies are inserted above the template row, which is removed afterwards
+        for i, values in enumerate(rows):
+            template_row.addprevious(copy.deepcopy(template_row))
+            cells = table.rows[row + i].cells
+            for slot in self.row_slots:
+                if any(key in slot.text for key in values.keys()):
+                    _, _, _, cell, paragraph = slot.location
+                    slot.fill(document, values, cells[cell].paragraphs[paragraph])
+        template_row.getparent().remove(template_row)
+
+        document.save(output_path)
+
+
+def _text_layout(text):
+    """Return how python-docx splits run text into <w:t> elements and which need xml:space."""
+    return tuple((bool(piece), len(piece.strip()) < len(piece)) for piece in _RUN_BREAKS.split(text))
+
+
+def _escape_xml_text(text):
+    """Escape text the way lxml serializes element text."""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _dos_date_time(date_time):
+    """Return the zip (time, date) fields of a ZipInfo.date_time."""
+    year, month, day, hour, minute, second = date_time
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+class _ZipMember:
+    """A member of the written zip archive, its data already compressed."""
+
+    def __init__(self, name, method, date_time, crc, data, file_size, external_attr):
+        self.filename = name
+        self.name = name.encode('utf-8')
+        self.flags = 0x800 if not name.isascii() else 0
+        self.method = method
+        self.time, self.date = _dos_date_time(date_time)
+        self.crc = crc
+        self.data = data
+        self.file_size = file_size
+        self.external_attr = external_attr
+
+    def with_data(self, data, method=zipfile.ZIP_DEFLATED):
+        """Return a copy of the member with other data, compressed with method."""
+        member = copy.copy(self)
+        member.method = method
+        member.crc = zlib.crc32(data)
+        member.file_size = len(data)
+        if method == zipfile.ZIP_DEFLATED:
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+            data = compressor.compress(data) + compressor.flush()
+        member.data = data
+        return member
+
+    def local_header(self):
+        return struct.pack('<4s5H3L2H', b'PK\x03\x04', 20, self.flags, self.method, self.time, self.date,
+                           self.crc, len(self.data), self.file_size, len(self.name), 0) + self.name
+
+    def central_header(self, offset):
+        return struct.pack('<4s6H3L5H2L', b'PK\x01\x02', 20, 20, self.flags, self.method, self.time,
+                           self.date, self.crc, len(self.data), self.file_size, len(self.name), 0, 0, 0, 0,
+                           self.external_attr, offset) + self.name
+
+
+class OoxmlReceiptTemplate:
+    """
+    A Word receipt template rendered by writing the .docx zip archive directly.
+
+    The main document XML is rendered once through ReceiptTemplate with
+    stand-ins for the values and split at them into static byte segments.
+    A receipt joins the segments with the XML-escaped values and writes a
+    new archive, copying all other members compressed as they are in the
+    template. The document XML is the same as ReceiptTemplate writes; a
+    receipt whose values would change the run layout (tabs, line breaks,
+    whitespace at the ends of a text element), contain placeholders or
+    characters not allowed in XML is rendered through ReceiptTemplate.
+    """
+
+    def __init__(self, template_path):
+        self.docx_template = ReceiptTemplate(template_path)
+        # Split document XML per tuple of placeholder keys
+        self._compiled = {}
+        self._lock = threading.Lock()
+
+        data = self.docx_template.data
+        self.members = []
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for info in archive.infolist():
+                # The data follows the local header, its name and extra field
+                name_length, extra_length = struct.unpack('<2H', data[info.header_offset + 26:info.header_offset + 30])
+                start = info.header_offset + 30 + name_length + extra_length
+                self.members.append(_ZipMember(
+                    info.filename, info.compress_type, info.date_time, info.CRC,
+                    data[start:start + info.compress_size], info.file_size, info.external_attr))
+
+    def _compile(self, keys):
+        """Return (segments, keys of the gaps, sentinel texts of the changed slots) for the placeholder keys."""
+        with self._lock:
+            if keys not in self._compiled:
+                sentinels = {key: SENTINEL.format(i) for i, key in enumerate(keys)}
+                buffer = io.BytesIO()
+                self.docx_template.render(sentinels, buffer)
+                with zipfile.ZipFile(buffer) as archive:
+                    xml = archive.read(self.docx_template.document_member)
+
+                parts = _SENTINEL_BYTES.split(xml)
+                slots = [(slot, slot.replaced_text(sentinels)) for slot in self.docx_template.slots
+                         if any(key in slot.text for key in keys)]
+                self._compiled[keys] = (parts[0::2], [int(i) for i in parts[1::2]], slots)
+            return self._compiled[keys]
+
+    def _fits(self, replacements, values, slots):
+        """Tell whether joining the segments gives the document ReceiptTemplate would write."""
+        if any(_INVALID_XML_CHARS.search(value) for value in values):
+            return False
+        for slot, sentinel_text in slots:
+            text = slot.replaced_text(replacements)
+            if (text != _SENTINEL_TEXT.sub(lambda m: values[int(m.group(1))], sentinel_text)
+                    or _text_layout(text) != _text_layout(sentinel_text)):
+                return False
+        return True
+
+    def render(self, replacements, output_path):
+        """
+        Write a receipt with the placeholders replaced.
+
+        Args:
+            replacements (dict): Values by placeholder, e.g. {'<<NAME>>': 'Anna Bauer'}
+            output_path: Path or file object of the .docx file to write
+        """
+        keys = tuple(replacements)
+        segments, gaps, slots = self._compile(keys)
+        values = [str(value) for value in replacements.values()]
+        if not self._fits(replacements, values, slots):
+            self.docx_template.render(replacements, output_path)
+            return
+
+        escaped = [_escape_xml_text(value).encode('utf-8') for value in values]
+        pieces = [segments[0]]
+        for gap, segment in zip(gaps, segments[1:]):
+            pieces.append(escaped[gap])
+            pieces.append(segment)
+        xml = b''.join(pieces)
+
+        document = self.docx_template.document_member
+        _write_zip(output_path, [member.with_data(xml) if member.filename == document else member
+                                 for member in self.members])
+
+
+def _write_zip(output_path, members):
+    """Write a zip archive of already compressed members."""
+    chunks = []
+    offsets = []
+    offset = 0
+    for member in members:
+        header = member.local_header()
+        offsets.append(offset)
+        chunks.append(header)
+        chunks.append(member.data)
+        offset += len(header) + len(member.data)
+
+    directory = b''.join(member.central_header(o) for member, o in zip(members, offsets))
+    chunks.append(directory)
+    chunks.append(struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, len(members), len(members),
+                              len(directory), offset, 0))
+
+    if hasattr(output_path, 'write'):
+        output_path.write(b''.join(chunks))
+    else:
+        with open(output_path, 'wb') as file:
+            file.write(b''.join(chunks))
+
+
+# Receipt template classes by the name of the renderer
+RENDERERS = {
+    'docx': ReceiptTemplate,
+    'ooxml': OoxmlReceiptTemplate,
+    'collective': CollectiveReceiptTemplate,
+}
+
+
+def load_receipt_template(template_path, renderer='docx'):
+    """
+    Return the compiled receipt template, compiled once per template file.
+
+    Args:
+        template_path (str): Path to the Word template file
+        renderer (str): Key of RENDERERS, 'docx' renders through python-docx,
+            'ooxml' writes the document XML and zip archive directly,
+            'collective' renders annual collective receipts, see CollectiveReceiptTemplate
+    Returns:
+        ReceiptTemplate, OoxmlReceiptTemplate or CollectiveReceiptTemplate: The template,
+            compiled again when the file changes
+    """
+    path = os.path.abspath(template_path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size, renderer)
+
+    if key not in _template_cache:
+        template = RENDERERS[renderer](path)
+
+        # Older versions of the file are not needed anymore
+        for stale_key in [k for k in _template_cache if k[0] == path]:
+            del _template_cache[stale_key]
+        _template_cache[key] = template
+
+    return _template_cache[key]
+
+
+def render_receipt(template_path, replacements, output_path, renderer='docx'):
+    """Render one receipt with the compiled template, e.g. in a worker process of a ReceiptPool."""
+    load_receipt_template(template_path, renderer).render(replacements, output_path)
+
+
+def set_german_locale(locales=GERMAN_LOCALES):
+    """Set the first available German locale and return its name, None if none is installed."""
+    for loc in locales:
+        try:
+            return locale.setlocale(locale.LC_ALL, loc)
+        except locale.Error:
+            continue
+    print("Warning: Could not set German locale.")
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def format_amount(amount):
+    """
+    Format a donation amount for the receipt, cached as standing orders repeat the same amounts.
+
+    Args:
+        amount (float): Amount in euros
+    Returns:
+        tuple: The amount as '12,50 EUR' and in German words, e.g. 'zwölf Euro und fünfzig Cent'
+    """
+    euros, cents = divmod(round(amount * 100), 100)
+
+    if euros == 1:
+        words = 'ein Euro'
+    else:
+        words = num2words(euros, lang='de') + ' Euro'
+
+    if cents > 0:
+        words += ' und ' + num2words(cents, lang='de') + ' Cent'
+
+    return f'{amount:.2f}'.replace('.', ',') + ' EUR', words
+
+
+class RenderContext:
+    """
+    Settings shared by all receipts of a run, resolved once before the first receipt.
+
+    Attributes:
+        locale (str): The German locale set for the run, None if none is installed
+        generation_date (str): Date of the run as DD.MM.YYYY, printed on every receipt
+    """
+
+    def __init__(self):
+        self.locale = set_german_locale()
+        self.generation_date = datetime.now().strftime('%d.%m.%Y')
+
+    def format_amount(self, amount):
+        """Return the amount as '12,50 EUR' and in German words, see format_amount."""
+        return format_amount(float(amount))
+
+
+def render_collective_receipt(template_path, replacements, rows, output_path):
+    """Render one collective receipt with the compiled template, e.g. in a worker process of a ReceiptPool."""
+    load_receipt_template(template_path, 'collective').render(replacements, output_path, rows)
+
+
+class CollectiveReceipt:
+    """
+    The donations of one address in one year, listed on one collective receipt.
+
+    Attributes:
+        address (tuple): Name, street, postal code and city of the donor
+        year (int): Year of the donations
+        donations (list): (date, amount, item) of the donations, item as passed to CollectiveReceipts.add
+    """
+
+    def __init__(self, address, year):
+        self.address = address
+        self.year = year
+        self.donations = []
+
+    @property
+    def total(self):
+        """Sum of the donations in euros, added up in cents."""
+        return sum(round(amount * 100) for _, amount, _ in self.donations) / 100
+
+    @property
+    def items(self):
+        """Items of the donations in date order."""
+        return [item for _, _, item in sorted(self.donations, key=lambda donation: donation[0])]
+
+    def filename(self):
+        """Name of the .docx file of the receipt."""
+        safe_name = ''.join(x for x in self.address[0] if x.isalnum())
+        return f'Sammelbestaetigung_{safe_name}_{self.year}.docx'
+
+    def replacements(self, context):
+        """Values of the placeholders outside the repeated row, with the total as <<SUMME>> and <<SUMME_WORTE>>."""
+        total, total_words = context.format_amount(self.total)
+        name, street, postal_code, city = self.address
+        return {
+            '<<NAME>>': name,
+            '<<STRASSE>>': street,
+            '<<PLZ>>': postal_code,
+            '<<ORT>>': city,
+            '<<SUMME>>': total,
+            '<<SUMME_WORTE>>': total_words,
+            '<<JAHR>>': str(self.year),
+            '<<ZEITRAUM>>': f'01.01.{self.year} - 31.12.{self.year}',
+            '<<DATUM_HEUTE>>': context.generation_date,
+        }
+
+    def rows(self, context):
+        """Values of the placeholders of the repeated row, one dict per donation in date order."""
+        rows = []
+        for date, amount, _ in sorted(self.donations, key=lambda donation: donation[0]):
+            amount_str, amount_words = context.format_amount(amount)
+            rows.append({
+                '<<DATUM_SPENDE>>': date.strftime('%d.%m.%Y'),
+                '<<BETRAG>>': amount_str,
+                '<<BETRAG_WORTE>>': amount_words,
+            })
+        return rows
+
+
+class CollectiveReceipts:
+    """
+    Groups matched donations per address and year for the annual collective receipts.
+
+    The groups are kept in a dict by address and year, adding a donation is a
+    single hash lookup, so the donations can be added while streaming the bank
+    files. Iterating yields the CollectiveReceipt of every group in the order
+    of their first donation.
+    """
+
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, address, donation_date, amount, item=None):
+        """
+        Add a matched donation.
+
+        Args:
+            address (tuple): Name, street, postal code and city of the matched address
+            donation_date (str): Date of the donation as DD.MM.YYYY
+            amount (float): Amount in euros
+            item: Kept with the donation, e.g. for logging
+        Raises:
+            ValueError: If the date is not a DD.MM.YYYY date
+        """
+        date = datetime.strptime(donation_date, '%d.%m.%Y')
+        address = tuple(str(value).strip() for value in address)
+        key = (address, date.year)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = CollectiveReceipt(address, date.year)
+        group.donations.append((date, float(amount), item))
+
+    def __len__(self):
+        return len(self.groups)
+
+    def __iter__(self):
+        return iter(self.groups.values())
+
+
+class ReceiptPool:
+    """
+    Generates receipts in worker processes and hands them back in the order they were submitted.
+
+    With one job the receipts are generated right away in this process.
+    Every worker process compiles the template once, see load_receipt_template.
+    """
+
+    def __init__(self, jobs=1):
+        self.executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+        self.pending = collections.deque()
+
+    def submit(self, item, func, *args):
+        """
+        Start func(*args) for item.
+
+        Args:
+            item: Returned with the result by completed, e.g. the log entry of the receipt
+            func: Picklable function generating the receipt
+        """
+        if self.executor is not None:
+            future = self.executor.submit(func, *args)
+        else:
+            future = Future()
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+        self.pending.append((item, future))
+
+    def completed(self, wait=False):
+        """
+        Yield (item, error) of the finished receipts in submission order, error None on success.
+
+        Args:
+            wait (bool): Wait for all receipts instead of stopping at the first unfinished one
+        """
+        while self.pending and (wait or self.pending[0][1].done()):
+            item, future = self.pending.popleft()
+            yield item, future.exception()
+
+    def close(self):
+        """Stop the worker processes, the pending receipts are finished first."""
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,43 @@
+"""
+Tests of loading the address workbook and its snapshot.
+"""
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import addresses
+
+TEST_ADDRESSES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_addresses.xlsx')
+
+
+def test_no_snapshot_without_password(tmp_path):
+    snapshot_path = str(tmp_path / 'addresses.snapshot')
+    address_df, address_index = addresses.load_indexed_addresses(TEST_ADDRESSES, snapshot_path=snapshot_path)
+
+    assert not os.path.exists(snapshot_path)
+    assert address_index.address_df is address_df
+
+
+def test_snapshot_with_empty_password_is_not_read(tmp_path):
+    snapshot_path = str(tmp_path / 'addresses.snapshot')
+    fingerprint = addresses.workbook_fingerprint(TEST_ADDRESSES)
+    # A snapshot anyone could have written, keyed by the empty password
+    salt = os.urandom(addresses.SNAPSHOT_SALT_SIZE)
+    token = addresses._snapshot_cipher('', salt).encrypt(b'not a pickle')
+    with open(snapshot_path, 'wb') as file:
+        file.write(addresses.SNAPSHOT_MAGIC + salt + fingerprint + token)
+
+    assert addresses.read_snapshot(snapshot_path, fingerprint, '') is None
+    assert addresses.read_snapshot(snapshot_path, fingerprint, None) is None
+
+
+def test_reload_returns_independent_copies():
+    address_df, address_index = addresses.load_indexed_addresses(TEST_ADDRESSES)
+    address_index.update(pd.concat([address_df, pd.DataFrame([{'Name': 'Erika Musterfrau'}])], ignore_index=True))
+
+    reloaded_df, reloaded_index = addresses.load_indexed_addresses(TEST_ADDRESSES)
+    assert len(reloaded_df) == len(address_df)
+    assert len(reloaded_index.full_entries) == len(address_df)
@@ -0,0 +1,117 @@
+"""
+Tests of the exact name matches, of re-matching the donors after addresses were added
+to the list and of the IBAN cache.
+"""
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from matching import (AddressIndex, MatchCache, PersistentMatchCache, find_best_match, find_best_matches,
+                      update_matches)
+
+ADDRESSES = pd.DataFrame({
+    'Name': ['Anna Bauer', 'Stefan Hoffmann', 'Julia Weber'],
+    'Straße': ['Gartenstraße 1', 'Lindenstraße 2', 'Schulstraße 3'],
+    'PLZ': [10115, 20095, 80331],
+    'Ort': ['Berlin', 'Hamburg', 'München'],
+})
+
+DONORS = ['BAUER, ANNA', 'Stefan Hofmann', 'Max Mustermann', 'Erika Musterfrau']
+
+
+def test_rows_sharing_a_key_are_scored():
+    # 'Stefan Weiß' of the joint entry and 'Müller, Anna' share the keys of the later rows
+    address_index = AddressIndex(pd.DataFrame({
+        'Name': ['Stefan und Jörg Weiß', 'Stefan Weiss', 'Müller, Anna', 'Anna Mueller', 'Julia Weber'],
+    }))
+    assert address_index.exact_match(['Stefan Weiss']) == (None, None)
+    assert address_index.exact_match(['Julia Weber']) == (4, 'Julia Weber')
+
+    matches = find_best_matches(['Stefan Weiss', 'Anna Mueller', 'WEBER, JULIA'], address_index, top_k=2)
+    assert [row.name for row, _, _ in matches.values()] == [1, 3, 4]
+    assert [score for _, score, _ in matches.values()] == [100, 100, 100]
+    assert find_best_match('Stefan Weiss', address_index)[0].name == 1
+    assert find_best_match('Anna Mueller', address_index)[0].name == 3
+
+
+def rematch_with_correction(address_index, cache):
+    """Match with the correction of the cache, then add rows to the list and re-match."""
+    matches = find_best_matches(DONORS, address_index, cache=cache, top_k=5)
+
+    added_df = pd.concat([ADDRESSES, pd.DataFrame([
+        {'Name': 'Erika Musterfrau', 'Straße': 'Ringstraße 9', 'PLZ': 60311, 'Ort': 'Frankfurt'},
+        {'Name': 'Max Mustermann', 'Straße': 'Marktplatz 7', 'PLZ': 1067, 'Ort': 'Dresden'},
+    ])], ignore_index=True)
+    added = address_index.update(added_df)
+    updated, rematched = update_matches(matches, address_index, added, top_k=5)
+    return matches, updated, rematched
+
+
+def test_update_matches_keeps_stored_correction():
+    cache = MatchCache()
+    cache.record_correction('Max Mustermann', 'Max Mustermann', 'Hauptstraße 5', '50667', 'Köln')
+    matches, updated, rematched = rematch_with_correction(AddressIndex(ADDRESSES.copy()), cache)
+
+    # The correction stays, the new row does not replace it
+    assert updated['Max Mustermann'] is matches['Max Mustermann']
+    assert updated['Max Mustermann'][0]['Ort'] == 'Köln'
+    assert 'Max Mustermann' not in rematched
+    # Donors without a match before find the added address
+    assert rematched == ['Erika Musterfrau']
+    assert updated['Erika Musterfrau'][0]['Ort'] == 'Frankfurt'
+    assert updated['BAUER, ANNA'][0]['Name'] == 'Anna Bauer'
+
+
+def test_update_matches_keeps_persisted_correction(tmp_path):
+    address_index = AddressIndex(ADDRESSES.copy())
+    cache = PersistentMatchCache(str(tmp_path / 'matches.sqlite'), address_index)
+    cache.record_correction('Max Mustermann', 'Max Mustermann', 'Hauptstraße 5', '50667', 'Köln')
+    cache.close()
+
+    # Read back from disk, the correction row is built by _correction_row
+    address_index = AddressIndex(ADDRESSES.copy())
+    cache = PersistentMatchCache(str(tmp_path / 'matches.sqlite'), address_index)
+    _, updated, rematched = rematch_with_correction(address_index, cache)
+    assert updated['Max Mustermann'][0]['Ort'] == 'Köln'
+    assert 'Max Mustermann' not in rematched
+
+
+def test_iban_keeps_match_score_and_is_stored_hashed(tmp_path):
+    path = str(tmp_path / 'matches.sqlite')
+    address_index = AddressIndex(ADDRESSES.copy())
+    cache = PersistentMatchCache(path, address_index, password='geheim')
+    cache.record_iban('DE89 3704 0044 0532 0130 00', address_index.row(1), 91, confirmed=False)
+    cache.record_iban('DE02 1203 0000 0000 2020 51', address_index.row(2), 85, confirmed=False)
+    cache.close()
+
+    with open(path, 'rb') as file:
+        assert b'DE89' not in file.read()
+
+    # The matched address of the second IBAN was removed from the list
+    cache = PersistentMatchCache(path, AddressIndex(ADDRESSES.iloc[:2].copy()), password='geheim')
+    known = cache.lookup_ibans(['de89370400440532013000', 'DE02120300000000202051'])
+    assert list(known) == ['DE89370400440532013000']
+    row, score = known['DE89370400440532013000']
+    assert (row['Name'], score) == ('Stefan Hoffmann', 91)
+    cache.close()
+
+    # The hashes are keyed by the password, other passwords find nothing
+    cache = PersistentMatchCache(path, address_index, password='anders')
+    assert cache.lookup_ibans(['DE89370400440532013000']) == {}
+    cache.close()
+
+
+def test_iban_not_stored_without_password(tmp_path):
+    path = str(tmp_path / 'matches.sqlite')
+    address_index = AddressIndex(ADDRESSES.copy())
+    cache = PersistentMatchCache(path, address_index)
+    cache.record_iban('DE89 3704 0044 0532 0130 00', address_index.row(1), 91, confirmed=False)
+    # Still known for the rest of the run
+    assert list(cache.lookup_ibans(['DE89370400440532013000'])) == ['DE89370400440532013000']
+    cache.close()
+
+    assert PersistentMatchCache(path, address_index).connection.execute(
+        'SELECT COUNT(*) FROM iban_addresses').fetchone() == (0,)